@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from corpus_index import CorpusIndex, CorpusIndexError, manifest_path_for
+
+
+AST_CACHE_NAME = "snapshots-ast-cache.json"
+AST_DIFF_NAME = "ast-diff.json"
+# Fingerprints depend on the ast module, so they are only reused by the same
+# Python minor version.
+AST_CACHE_VERSION = f"1-py{sys.version_info[0]}.{sys.version_info[1]}"
+
+
+def _digest(node: ast.AST | list) -> str:
+    dumped = ast.dump(ast.Module(body=node, type_ignores=[]) if isinstance(node, list) else node)
+    return hashlib.sha256(dumped.encode("utf-8")).hexdigest()[:16]
+
+
+def _assigned_names(targets: list[ast.expr]) -> list[str]:
+    names = []
+    for target in targets:
+        for node in ast.walk(target):
+            if isinstance(node, ast.Name):
+                names.append(node.id)
+    return names
+
+
+def _function_entry(node: ast.FunctionDef | ast.AsyncFunctionDef) -> dict:
+    args = node.args
+    params = [a.arg for a in [*args.posonlyargs, *args.args]]
+    if args.vararg:
+        params.append("*" + args.vararg.arg)
+    params += [a.arg for a in args.kwonlyargs]
+    if args.kwarg:
+        params.append("**" + args.kwarg.arg)
+    local_names = set()
+    for child in ast.walk(node):
+        if isinstance(child, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            local_names.update(_assigned_names(child.targets if isinstance(child, ast.Assign) else [child.target]))
+    return {
+        "kind": "function",
+        "params": params,
+        "signature": f"({ast.unparse(args)})" + (f" -> {ast.unparse(node.returns)}" if node.returns else ""),
+        "decorators": [ast.unparse(d) for d in node.decorator_list],
+        "body": _digest(node.body),
+        "locals": sorted(local_names),
+    }
+
+
+def _collect_defs(body: list[ast.stmt], prefix: str, defs: dict[str, dict]) -> None:
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            defs[prefix + node.name] = _function_entry(node)
+        elif isinstance(node, ast.ClassDef):
+            own = [stmt for stmt in node.body if not isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))]
+            defs[prefix + node.name] = {
+                "kind": "class",
+                "bases": [ast.unparse(b) for b in node.bases],
+                "decorators": [ast.unparse(d) for d in node.decorator_list],
+                "body": _digest(own),
+            }
+            _collect_defs(node.body, f"{prefix}{node.name}.", defs)
+
+
+def fingerprint_source(source: str) -> dict:
+    """A compact structural summary of a Python file.
+
+    Every function, method and class (by qualified name) with its signature
+    and a hash of its body; module-level assignments with a hash of their
+    value; and the import statements.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        return {"error": f"SyntaxError: {e.msg} (line {e.lineno})"}
+    defs: dict[str, dict] = {}
+    _collect_defs(tree.body, "", defs)
+    assigns: dict[str, str] = {}
+    imports: list[str] = []
+    for node in tree.body:
+        if isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+            for name in _assigned_names(node.targets if isinstance(node, ast.Assign) else [node.target]):
+                assigns[name] = _digest(node.value)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(ast.unparse(node))
+    return {"defs": defs, "assigns": assigns, "imports": imports}
+
+
+class FingerprintCache:
+    """Per-file results of `compute`, keyed by content sha256.
+
+    Defaults to AST fingerprints; snapshot_metrics.py reuses it for its
+    metrics. The whole cache is dropped when `version` changes.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        compute: Callable[[str], dict] = fingerprint_source,
+        version: str = AST_CACHE_VERSION,
+    ) -> None:
+        self.path = path
+        self.compute = compute
+        self.version = version
+        self.fingerprints: dict[str, dict] = {}
+        self.dirty = False
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+            if payload.get("version") == version:
+                self.fingerprints = payload["fingerprints"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+    def fill(self, sources: dict[str, Path], *, jobs: int = 1) -> int:
+        # Parses the files whose hash is not cached yet; returns how many.
+        missing = sorted(digest for digest in sources if digest not in self.fingerprints)
+        texts = [sources[digest].read_text(encoding="utf-8") for digest in missing]
+        if jobs > 1 and len(texts) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(self.compute, texts, chunksize=16))
+        else:
+            results = [self.compute(text) for text in texts]
+        self.fingerprints.update(zip(missing, results))
+        self.dirty = self.dirty or bool(missing)
+        return len(missing)
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        payload = {"version": self.version, "fingerprints": self.fingerprints}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(payload, separators=(",", ":")) + "\n", encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def _change(kind: str, name: str, text: str) -> dict:
+    return {"kind": kind, "name": name, "text": text}
+
+
+def _label(name: str, entry: dict) -> str:
+    return f"class {name}" if entry["kind"] == "class" else f"{name}()"
+
+
+def diff_fingerprints(old: dict, new: dict) -> list[dict]:
+    """Function- and class-level changes from one version of a file to the next."""
+    if "error" in old or "error" in new:
+        if old.get("error") != new.get("error"):
+            return [_change("syntax", "", new.get("error") or f"parses again (was: {old['error']})")]
+        return []
+
+    changes = []
+    old_defs, new_defs = old["defs"], new["defs"]
+    for name in sorted(old_defs.keys() - new_defs.keys()):
+        changes.append(_change("removed", name, f"removed {_label(name, old_defs[name])}"))
+    for name in sorted(new_defs.keys() - old_defs.keys()):
+        changes.append(_change("added", name, f"added {_label(name, new_defs[name])}"))
+    for name in sorted(old_defs.keys() & new_defs.keys()):
+        before, after = old_defs[name], new_defs[name]
+        label = _label(name, after)
+        if before["kind"] != after["kind"]:
+            changes.append(_change("kind", name, f"{name} changed from a {before['kind']} to a {after['kind']}"))
+            continue
+        if after["kind"] == "function":
+            gained = [p for p in after["params"] if p not in before["params"]]
+            lost = [p for p in before["params"] if p not in after["params"]]
+            for param in gained:
+                changes.append(_change("param_added", name, f"{label} gained a {param} parameter"))
+            for param in lost:
+                changes.append(_change("param_removed", name, f"{label} lost its {param} parameter"))
+            if not gained and not lost and before["signature"] != after["signature"]:
+                changes.append(_change("signature", name, f"{label} signature: {before['signature']} -> {after['signature']}"))
+        else:
+            if before["bases"] != after["bases"]:
+                changes.append(_change("bases", name, f"{label} bases: ({', '.join(before['bases'])}) -> ({', '.join(after['bases'])})"))
+        if before["decorators"] != after["decorators"]:
+            changes.append(_change("decorators", name, f"{label} decorators: {before['decorators']} -> {after['decorators']}"))
+        if before["body"] != after["body"]:
+            changes.append(_change("body", name, f"{label} body changed"))
+
+    old_assigns, new_assigns = old["assigns"], new["assigns"]
+    for name in sorted(new_assigns.keys() - old_assigns.keys()):
+        # A module-level name that used to be assigned inside a function.
+        sources = [
+            fn for fn, entry in old_defs.items()
+            if entry["kind"] == "function" and name in entry["locals"]
+            and (fn not in new_defs or name not in new_defs[fn].get("locals", []))
+        ]
+        if sources:
+            changes.append(_change("hoisted", name, f"{name} hoisted from {', '.join(s + '()' for s in sources)} to module level"))
+        else:
+            changes.append(_change("global_added", name, f"module-level {name} added"))
+    for name in sorted(old_assigns.keys() - new_assigns.keys()):
+        changes.append(_change("global_removed", name, f"module-level {name} removed"))
+    for name in sorted(old_assigns.keys() & new_assigns.keys()):
+        if old_assigns[name] != new_assigns[name]:
+            changes.append(_change("global_changed", name, f"module-level {name} value changed"))
+
+    for statement in new["imports"]:
+        if statement not in old["imports"]:
+            changes.append(_change("import_added", "", f"added {statement}"))
+    for statement in old["imports"]:
+        if statement not in new["imports"]:
+            changes.append(_change("import_removed", "", f"removed {statement}"))
+    return changes
+
+
+def trace_diffs(manifest: dict, fingerprints: dict[str, dict]) -> list[dict]:
+    # Per step, the structural changes of every Python file whose content
+    # differs from the previous step.
+    steps = []
+    previous: dict[str, str] = {}
+    for step in manifest["steps"]:
+        current = {p: h for p, h in step["file_hashes"].items() if p.endswith(".py")}
+        files = {}
+        for path in sorted(previous.keys() | current.keys()):
+            before, after = previous.get(path), current.get(path)
+            if before == after:
+                continue
+            if before is None:
+                files[path] = {"status": "added", "changes": diff_fingerprints(_EMPTY, fingerprints[after])}
+            elif after is None:
+                files[path] = {"status": "removed", "changes": []}
+            else:
+                files[path] = {"status": "changed", "changes": diff_fingerprints(fingerprints[before], fingerprints[after])}
+        steps.append({"number": step["number"], "files": files})
+        previous = current
+    return steps
+
+
+_EMPTY = {"defs": {}, "assigns": {}, "imports": []}
+
+
+def write_sidecar(trace_path: Path, steps: list[dict]) -> bool:
+    # snapshots/<trace-stem>/ast-diff.json; only rewritten when it changes.
+    sidecar = trace_path.parent / "snapshots" / trace_path.stem / AST_DIFF_NAME
+    text = json.dumps({"trace": trace_path.as_posix(), "steps": steps}, indent=2) + "\n"
+    try:
+        if sidecar.read_text(encoding="utf-8") == text:
+            return False
+    except FileNotFoundError:
+        pass
+    sidecar.write_text(text, encoding="utf-8")
+    return True
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Write snapshots/<trace>/ast-diff.json: per step, the function- and class-level changes of "
+            "every Python file since the previous step. Each distinct file is parsed once; "
+            f"fingerprints are cached in <traces-root>/{AST_CACHE_NAME}."
+        )
+    )
+    parser.add_argument("--traces-root", type=Path, default=Path("traces"))
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Processes to parse new files with")
+    parser.add_argument("--trace", type=Path, default=None, help="Print one trace's changes instead of writing sidecars")
+    args = parser.parse_args(argv)
+
+    try:
+        index = CorpusIndex.load_or_build(args.traces_root)
+        sources = index.blob_locations(suffix=".py")
+    except CorpusIndexError as e:
+        raise SystemExit(f"error: {e}")
+    cache = FingerprintCache(args.traces_root / AST_CACHE_NAME)
+    parsed = cache.fill(sources, jobs=args.jobs)
+    cache.save()
+
+    trace_paths = [Path(info.trace_path) for info in index.traces]
+    if args.trace is not None:
+        trace_paths = [args.trace]
+    written = 0
+    for trace_path in trace_paths:
+        manifest_path = manifest_path_for(trace_path)
+        if manifest_path is None:
+            raise SystemExit(f"error: no manifest for {trace_path}; run extract_snapshots.py first")
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        steps = trace_diffs(manifest, cache.fingerprints)
+        if args.trace is not None:
+            for step in steps:
+                for path, entry in step["files"].items():
+                    print(f"step {step['number']:02d} {path} ({entry['status']})")
+                    for change in entry["changes"]:
+                        print(f"  {change['text']}")
+        elif write_sidecar(trace_path, steps):
+            written += 1
+    if args.trace is None:
+        print(f"{len(sources)} distinct Python files ({parsed} parsed), {written} of {len(trace_paths)} sidecars updated")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
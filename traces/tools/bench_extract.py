@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable
+
+from extract_snapshots import (
+    ExtractOptions,
+    extract_all,
+    iter_trace_files,
+    iter_trace_steps,
+    parse_trace_markdown,
+)
+
+
+BENCHMARKS = ("discover", "parse", "stream-parse", "full-state", "changed-only", "manifests")
+
+# Written to a --workdir so later runs know it holds a generated corpus.
+WORKDIR_MARKER = ".bench-extract"
+
+FENCE_LANGUAGES = ["python", "text", "json", "sh", "toml", ""]
+FILE_NAMES = ["main.py", "core.py", "pkg/util.py", "data/input.json", "notes.txt", "patterns/grid.txt", "run.sh"]
+TITLE_SEPARATORS = [": ", " – ", " - ", " — "]
+WORDS = (
+    "grid step parse value error check loop refactor helper test output count word maze path "
+    "render border story node choice seed width height frame cell state file line token"
+).split()
+
+
+@dataclass(frozen=True)
+class CorpusConfig:
+    traces: int = 50
+    steps: int = 20
+    files_per_trace: int = 3
+    max_file_bytes: int = 16 * 1024
+    seed: int = 0
+
+
+def _line(rng: random.Random) -> str:
+    indent = "    " * rng.randrange(3)
+    return indent + " ".join(rng.choices(WORDS, k=rng.randint(2, 10)))
+
+
+def _file_size(rng: random.Random, max_bytes: int) -> int:
+    # Log-uniform between 200 bytes and max_bytes: mostly small files with a long tail.
+    low = min(200, max_bytes)
+    return int(math.exp(rng.uniform(math.log(low), math.log(max_bytes))))
+
+
+def _lines_for(rng: random.Random, size: int) -> list[str]:
+    lines: list[str] = []
+    total = 0
+    while total < size:
+        line = _line(rng)
+        lines.append(line)
+        total += len(line) + 1
+    return lines
+
+
+def generate_trace(rng: random.Random, config: CorpusConfig, title: str) -> str:
+    paths = rng.sample(FILE_NAMES, k=min(config.files_per_trace, len(FILE_NAMES)))
+    languages = {path: rng.choice(FENCE_LANGUAGES) for path in paths}
+    files: dict[str, list[str]] = {}
+    out = [f"# {title}\n"]
+
+    for number in range(1, config.steps + 1):
+        heading = "##" if rng.random() < 0.9 else "###"
+        out.append(f"\n{heading} Step {number}{rng.choice(TITLE_SEPARATORS)}{' '.join(rng.choices(WORDS, k=4))}\n\n")
+        out.append(" ".join(rng.choices(WORDS, k=rng.randint(10, 60))) + ".\n")
+
+        changed = paths if number == 1 else rng.sample(paths, k=rng.randint(1, len(paths)))
+        for path in changed:
+            if path not in files:
+                files[path] = _lines_for(rng, _file_size(rng, config.max_file_bytes))
+            else:
+                lines = files[path]
+                start = rng.randrange(len(lines) + 1)
+                end = min(len(lines), start + rng.randint(0, 5))
+                lines[start:end] = [_line(rng) for _ in range(rng.randint(0, 6))]
+                if not lines:
+                    lines.append(_line(rng))
+            out.append(f"\nSnapshot: {path}\n```{languages[path]}\n")
+            out.append("\n".join(files[path]) + "\n```\n")
+    return "".join(out)
+
+
+def generate_corpus(root: Path, config: CorpusConfig) -> list[Path]:
+    # <root>/<problem>/<persona>/trace-NN.md, like the real corpus.
+    rng = random.Random(config.seed)
+    written = []
+    for i in range(config.traces):
+        problem = f"problem-{i // 70:03d}"
+        persona = f"persona-{(i // 10) % 7}"
+        trace_path = root / problem / persona / f"trace-{i % 10 + 1:02d}.md"
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        trace_path.write_text(generate_trace(rng, config, f"Trace {i}"), encoding="utf-8")
+        written.append(trace_path)
+    return written
+
+
+def prepare_workdir(root: Path) -> None:
+    """Make `root` ready for a fresh corpus.
+
+    An existing directory is only reused if an earlier run marked it, and
+    then only what the benchmark generates is removed: trace files, their
+    snapshots and the manifest benchmark's output.
+    """
+    marker = root / WORKDIR_MARKER
+    if root.exists() and not marker.exists():
+        if not root.is_dir() or any(root.iterdir()):
+            raise SystemExit(f"error: --workdir {root} exists and was not created by bench_extract.py; pick an empty directory")
+    root.mkdir(parents=True, exist_ok=True)
+    marker.touch()
+    for trace_path in root.glob("problem-*/persona-*/trace-*.md"):
+        trace_path.unlink()
+    for generated in [*root.glob("problem-*/persona-*/snapshots"), root / "manifest-bench"]:
+        shutil.rmtree(generated, ignore_errors=True)
+    for persona_dir in root.glob("problem-*/persona-*"):
+        if not any(persona_dir.iterdir()):
+            persona_dir.rmdir()
+    for problem_dir in root.glob("problem-*"):
+        if problem_dir.is_dir() and not any(problem_dir.iterdir()):
+            problem_dir.rmdir()
+
+
+def _time(fn: Callable[[], object], repeat: int, setup: Callable[[], object] | None = None) -> list[float]:
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def _remove_snapshots(trace_paths: list[Path]) -> None:
+    for snapshots_dir in {trace_path.parent / "snapshots" for trace_path in trace_paths}:
+        shutil.rmtree(snapshots_dir, ignore_errors=True)
+
+
+def run_benchmarks(root: Path, trace_paths: list[Path], *, repeat: int, jobs: int, only: set[str]) -> dict:
+    trace_paths = sorted(trace_paths)
+    results: dict[str, dict] = {}
+
+    def record(name: str, fn: Callable[[], object], setup: Callable[[], object] | None = None) -> None:
+        if name not in only:
+            return
+        runs = _time(fn, repeat, setup)
+        results[name] = {
+            "min_seconds": round(min(runs), 6),
+            "median_seconds": round(statistics.median(runs), 6),
+            "runs": [round(r, 6) for r in runs],
+        }
+        print(f"{name:<13} min {min(runs):9.4f}s  median {statistics.median(runs):9.4f}s", file=sys.stderr)
+
+    record("discover", lambda: list(iter_trace_files(root)))
+    record("parse", lambda: [parse_trace_markdown(t) for t in trace_paths])
+    record("stream-parse", lambda: [sum(1 for _ in iter_trace_steps(t)) for t in trace_paths])
+
+    full_state = ExtractOptions(write_full_state=True, force=True)
+    changed_only = ExtractOptions(write_full_state=False, force=True)
+    record("full-state", lambda: extract_all(trace_paths, full_state, jobs=jobs), lambda: _remove_snapshots(trace_paths))
+    record("changed-only", lambda: extract_all(trace_paths, changed_only, jobs=jobs), lambda: _remove_snapshots(trace_paths))
+
+    if "manifests" in only:
+        manifests = [r.manifest for r in extract_all(trace_paths, full_state, jobs=jobs) if r.manifest is not None]
+        out_dir = root / "manifest-bench"
+        out_dir.mkdir(exist_ok=True)
+
+        def write_manifests() -> None:
+            for i, manifest in enumerate(manifests):
+                (out_dir / f"manifest-{i}.json").write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+
+        record("manifests", write_manifests)
+    return results
+
+
+def compare_to_baseline(current: dict, baseline: dict, *, tolerance: float) -> list[str]:
+    if current["config"] != baseline["config"]:
+        raise SystemExit("error: baseline was recorded with a different corpus config; re-record it")
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["min_seconds"] / base["min_seconds"] if base["min_seconds"] else math.inf
+        status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+        print(f"{name:<13} {base['min_seconds']:9.4f}s -> {result['min_seconds']:9.4f}s  x{ratio:5.2f}  {status}", file=sys.stderr)
+        if status != "ok":
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark the snapshot extractor on a seeded synthetic corpus.\n\n"
+            "Record a baseline:   bench_extract.py --output baseline.json\n"
+            "Check for regressions: bench_extract.py --baseline baseline.json"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    defaults = CorpusConfig()
+    parser.add_argument("--traces", type=int, default=defaults.traces)
+    parser.add_argument("--steps", type=int, default=defaults.steps, help="Steps per trace")
+    parser.add_argument("--files-per-trace", type=int, default=defaults.files_per_trace)
+    parser.add_argument("--max-file-bytes", type=int, default=defaults.max_file_bytes)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the minimum is compared")
+    parser.add_argument("--jobs", type=int, default=1, help="--jobs passed to the extractor benchmarks")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--workdir", type=Path, default=None, help="Generate the corpus here instead of a temp dir")
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this path")
+    parser.add_argument("--baseline", type=Path, default=None, help="Compare against results recorded with --output")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    only = {name.strip() for name in args.only.split(",") if name.strip()}
+    unknown = only - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    config = CorpusConfig(
+        traces=args.traces,
+        steps=args.steps,
+        files_per_trace=args.files_per_trace,
+        max_file_bytes=args.max_file_bytes,
+        seed=args.seed,
+    )
+    tmp = None
+    if args.workdir is None:
+        tmp = tempfile.TemporaryDirectory(prefix="bench-extract-")
+        root = Path(tmp.name)
+    else:
+        root = args.workdir
+        prepare_workdir(root)
+
+    try:
+        start = time.perf_counter()
+        trace_paths = generate_corpus(root, config)
+        corpus_bytes = sum(t.stat().st_size for t in trace_paths)
+        print(
+            f"generated {len(trace_paths)} traces ({corpus_bytes / 1e6:.1f} MB) in {time.perf_counter() - start:.2f}s",
+            file=sys.stderr,
+        )
+        current = {
+            "config": asdict(config),
+            "repeat": args.repeat,
+            "jobs": args.jobs,
+            "corpus_bytes": corpus_bytes,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": run_benchmarks(root, trace_paths, repeat=args.repeat, jobs=args.jobs, only=only),
+        }
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_to_baseline(current, baseline, tolerance=args.tolerance)
+        if regressions:
+            print(f"error: slower than baseline: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Content-addressed store: each distinct file body is kept once under `root/ab/cdef...`.
+
+    Snapshot files are materialized from the store as hardlinks, falling back to
+    symlinks and then plain copies when the filesystem does not support links.
+    Blobs are made read-only so that writing through a hardlink fails loudly
+    instead of silently changing every snapshot that shares the blob.
+    """
+
+    LINK_MODES = ("hardlink", "symlink", "copy")
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._known: set[str] = set()
+        self._link_mode_index = 0
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:]
+
+    def put(self, data: bytes, digest: str | None = None) -> str:
+        if digest is None:
+            digest = hash_bytes(data)
+        if digest in self._known:
+            return digest
+        path = self.blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename so concurrent workers never observe a partial blob.
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.chmod(tmp_name, 0o444)
+                os.replace(tmp_name, path)
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        self._known.add(digest)
+        return digest
+
+    def read(self, digest: str) -> bytes:
+        return self.blob_path(digest).read_bytes()
+
+    @property
+    def link_mode(self) -> str:
+        return self.LINK_MODES[self._link_mode_index]
+
+    def materialize(self, digest: str, target: Path) -> str:
+        source = self.blob_path(digest)
+        if target.is_symlink() or target.exists():
+            target.unlink()
+        while True:
+            mode = self.link_mode
+            try:
+                if mode == "hardlink":
+                    os.link(source, target)
+                elif mode == "symlink":
+                    os.symlink(os.path.relpath(source, target.parent), target)
+                else:
+                    shutil.copyfile(source, target)
+                return mode
+            except OSError:
+                if mode == "copy":
+                    raise
+                self._link_mode_index += 1
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import NamedTuple
+
+from extract_snapshots import stat_key
+
+
+INDEX_CACHE_NAME = "snapshots-index.json"
+INDEX_CACHE_VERSION = 2
+# In order of preference when a trace has several kinds of output.
+MANIFEST_MODES = ("full-state", "changed-only", "delta")
+
+
+class CorpusIndexError(Exception):
+    """The extracted snapshots cannot be indexed or read as asked; re-extracting them fixes it."""
+
+
+@dataclass(frozen=True)
+class TraceInfo:
+    problem: str
+    persona: str
+    name: str
+    trace_path: str
+    manifest_path: str
+    # (mtime_ns, size) of the manifest when it was indexed.
+    manifest_stat: tuple[int, int]
+    steps: tuple[tuple[int, str], ...]
+    # The layout the manifest describes ("full-state", "changed-only" or
+    # "delta") and how its files are stored ("tree", or "delta" for
+    # delta-encoded output, which snapshot_delta.materialize() reads).
+    mode: str = "full-state"
+    encoding: str = "tree"
+
+    @property
+    def output_root(self) -> Path:
+        return Path(self.manifest_path).parent
+
+
+class Snapshot(NamedTuple):
+    problem: str
+    persona: str
+    trace: str
+    step: int
+    path: str
+    sha256: str
+    changed: bool
+    trace_path: str
+    # Where the file's content is on disk: <output_root>/step-<source_step>/
+    # <path>. In changed-only output that is the last step that wrote it.
+    output_root: str
+    source_step: int
+    encoding: str
+
+    def location(self) -> Path:
+        if self.encoding != "tree":
+            raise CorpusIndexError(
+                f"{self.trace_path}: snapshots are {self.encoding}-encoded; "
+                "re-extract them without --delta to read their files"
+            )
+        return Path(self.output_root) / f"step-{self.source_step:02d}" / self.path
+
+
+class _Row(NamedTuple):
+    trace_id: int
+    step: int
+    path: str
+    sha256: str
+    changed: bool
+    source_step: int
+
+
+def resolve_trace_path(traces_root: Path, entry: str) -> Path:
+    # Summaries list traces relative to the traces root. Older ones used the
+    # path the extractor was given, relative to the directory it ran in.
+    candidate = traces_root / entry
+    if manifest_path_for(candidate) is None and manifest_path_for(Path(entry)) is not None:
+        return Path(entry)
+    return candidate
+
+
+def manifest_path_for(trace_path: Path) -> Path | None:
+    for mode in MANIFEST_MODES:
+        candidate = trace_path.parent / "snapshots" / trace_path.stem / mode / "manifest.json"
+        if candidate.exists():
+            return candidate
+    return None
+
+
+class CorpusIndex:
+    """All snapshot manifests of a corpus, loaded once and queried in memory.
+
+    Each (trace, step, file) of the full workspace is one row. Problem,
+    persona and path strings are interned, and rows are indexed by trace and
+    by path so the common queries only touch their candidate rows.
+    """
+
+    def __init__(self, traces: list[TraceInfo], rows: list[_Row]) -> None:
+        self.traces = traces
+        self.rows = rows
+        self._by_trace: dict[int, list[int]] = {}
+        self._by_path: dict[str, list[int]] = {}
+        for i, row in enumerate(rows):
+            self._by_trace.setdefault(row.trace_id, []).append(i)
+            self._by_path.setdefault(row.path, []).append(i)
+
+    @classmethod
+    def build(cls, traces_root: Path) -> CorpusIndex:
+        summary_path = traces_root / "snapshots-summary.json"
+        try:
+            summary = json.loads(summary_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise CorpusIndexError(f"no {summary_path}; run extract_snapshots.py first") from None
+        traces: list[TraceInfo] = []
+        rows: list[_Row] = []
+        for trace_str in summary["traces"]:
+            trace_path = resolve_trace_path(traces_root, trace_str)
+            manifest_path = manifest_path_for(trace_path)
+            if manifest_path is None:
+                raise CorpusIndexError(f"no manifest for {trace_path}; run extract_snapshots.py first")
+            cls._add_manifest(traces, rows, trace_path, manifest_path)
+        return cls(traces, rows)
+
+    @staticmethod
+    def _add_manifest(traces: list[TraceInfo], rows: list[_Row], trace_path: Path, manifest_path: Path) -> None:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("extractor_version", 0) < 2:
+            raise CorpusIndexError(f"{manifest_path} predates file hashes; re-run extract_snapshots.py --force")
+        mode = manifest_path.parent.name
+        trace_id = len(traces)
+        traces.append(
+            TraceInfo(
+                problem=sys.intern(trace_path.parent.parent.name),
+                persona=sys.intern(trace_path.parent.name),
+                name=sys.intern(trace_path.stem),
+                trace_path=trace_path.as_posix(),
+                manifest_path=manifest_path.as_posix(),
+                manifest_stat=stat_key(manifest_path),
+                steps=tuple((step["number"], step["title"]) for step in manifest["steps"]),
+                mode=mode,
+                encoding=manifest.get("encoding", "tree"),
+            )
+        )
+        # Changed-only steps only hold the files they wrote; the others are
+        # read from the last step that wrote them.
+        last_written: dict[str, int] = {}
+        for step in manifest["steps"]:
+            changed = set(step["changed_files"])
+            for rel_path in step.get("written_files", step["changed_files"]):
+                last_written[rel_path] = step["number"]
+            for rel_path, digest in step["file_hashes"].items():
+                source_step = step["number"] if mode == "full-state" else last_written.get(rel_path)
+                if source_step is None:
+                    raise CorpusIndexError(
+                        f"{manifest_path}: step {step['number']} lists {rel_path}, but no step wrote it; "
+                        "re-run extract_snapshots.py --force"
+                    )
+                rows.append(
+                    _Row(trace_id, step["number"], sys.intern(rel_path), sys.intern(digest), rel_path in changed, source_step)
+                )
+
+    def stale_traces(self) -> list[str]:
+        # Only stats the indexed manifests; it does not walk the tree.
+        stale = []
+        for info in self.traces:
+            try:
+                if stat_key(Path(info.manifest_path)) != info.manifest_stat:
+                    stale.append(info.trace_path)
+            except FileNotFoundError:
+                stale.append(info.trace_path)
+        return stale
+
+    def save(self, cache_path: Path) -> None:
+        strings: dict[str, int] = {}
+
+        def sid(value: str) -> int:
+            return strings.setdefault(value, len(strings))
+
+        payload = {
+            "version": INDEX_CACHE_VERSION,
+            "traces": [
+                [
+                    sid(t.problem),
+                    sid(t.persona),
+                    sid(t.name),
+                    t.trace_path,
+                    t.manifest_path,
+                    list(t.manifest_stat),
+                    [list(step) for step in t.steps],
+                    t.mode,
+                    t.encoding,
+                ]
+                for t in self.traces
+            ],
+            "rows": [[r.trace_id, r.step, sid(r.path), sid(r.sha256), int(r.changed), r.source_step] for r in self.rows],
+        }
+        payload["strings"] = list(strings)
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(payload, separators=(",", ":")) + "\n", encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+
+    @classmethod
+    def load(cls, cache_path: Path) -> CorpusIndex:
+        payload = json.loads(cache_path.read_text(encoding="utf-8"))
+        if payload.get("version") != INDEX_CACHE_VERSION:
+            raise ValueError(f"{cache_path}: unsupported index cache version")
+        strings = [sys.intern(s) for s in payload["strings"]]
+        traces = [
+            TraceInfo(
+                problem=strings[problem],
+                persona=strings[persona],
+                name=strings[name],
+                trace_path=trace_path,
+                manifest_path=manifest_path,
+                manifest_stat=tuple(manifest_stat),
+                steps=tuple((number, title) for number, title in steps),
+                mode=mode,
+                encoding=encoding,
+            )
+            for problem, persona, name, trace_path, manifest_path, manifest_stat, steps, mode, encoding in payload["traces"]
+        ]
+        rows = [_Row(t, step, strings[p], strings[h], bool(c), s) for t, step, p, h, c, s in payload["rows"]]
+        return cls(traces, rows)
+
+    @classmethod
+    def load_or_build(cls, traces_root: Path, cache_path: Path | None = None, *, rebuild: bool = False) -> CorpusIndex:
+        if cache_path is None:
+            cache_path = traces_root / INDEX_CACHE_NAME
+        summary_path = traces_root / "snapshots-summary.json"
+        # A newer summary means the set of traces may have changed.
+        if (
+            not rebuild
+            and cache_path.exists()
+            and summary_path.exists()
+            and cache_path.stat().st_mtime_ns >= summary_path.stat().st_mtime_ns
+        ):
+            try:
+                index = cls.load(cache_path)
+            except (ValueError, KeyError, json.JSONDecodeError):
+                index = None
+            if index is not None and not index.stale_traces():
+                return index
+        index = cls.build(traces_root)
+        index.save(cache_path)
+        return index
+
+    def query(
+        self,
+        *,
+        problem: str | None = None,
+        persona: str | None = None,
+        trace: str | None = None,
+        step: int | None = None,
+        path: str | None = None,
+        changed: bool | None = None,
+        final: bool = False,
+    ) -> list[Snapshot]:
+        """Snapshots matching every given filter.
+
+        `trace` matches either the trace name (`trace-01`) or its full path.
+        With `final=True`, only each trace's last step is considered.
+        """
+        trace_ids = [
+            i
+            for i, t in enumerate(self.traces)
+            if (problem is None or t.problem == problem)
+            and (persona is None or t.persona == persona)
+            and (trace is None or trace in (t.name, t.trace_path))
+        ]
+        if path is not None:
+            wanted = set(trace_ids)
+            candidates = [i for i in self._by_path.get(path, []) if self.rows[i].trace_id in wanted]
+        else:
+            candidates = [i for trace_id in trace_ids for i in self._by_trace.get(trace_id, [])]
+
+        results = []
+        for i in candidates:
+            row = self.rows[i]
+            info = self.traces[row.trace_id]
+            if step is not None and row.step != step:
+                continue
+            if final and (not info.steps or row.step != info.steps[-1][0]):
+                continue
+            if changed is not None and row.changed != changed:
+                continue
+            results.append(
+                Snapshot(
+                    info.problem,
+                    info.persona,
+                    info.name,
+                    row.step,
+                    row.path,
+                    row.sha256,
+                    row.changed,
+                    info.trace_path,
+                    info.output_root.as_posix(),
+                    row.source_step,
+                    info.encoding,
+                )
+            )
+        return results
+
+    def problems(self) -> list[str]:
+        return sorted({t.problem for t in self.traces})
+
+    def personas(self) -> list[str]:
+        return sorted({t.persona for t in self.traces})
+
+    def distinct_blobs(self, *, suffix: str | None = None) -> dict[str, Snapshot]:
+        # One representative snapshot per distinct file body, among the files
+        # whose path ends with `suffix`. Filtering first matters: a .py file
+        # and a .txt file with the same body share one digest.
+        blobs: dict[str, Snapshot] = {}
+        for snapshot in self.query():
+            if suffix is None or snapshot.path.endswith(suffix):
+                blobs.setdefault(snapshot.sha256, snapshot)
+        return blobs
+
+    def blob_locations(self, *, suffix: str | None = None) -> dict[str, Path]:
+        # Where to read each distinct file body from, for FingerprintCache.fill().
+        return {digest: snapshot.location() for digest, snapshot in self.distinct_blobs(suffix=suffix).items()}
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Query extracted snapshots across the corpus, e.g.\n"
+            "  corpus_index.py --path maze.py --final\n"
+            "  corpus_index.py --path harness.py --changed"
+        ),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--traces-root", type=Path, default=Path("traces"))
+    parser.add_argument("--cache", type=Path, default=None, help=f"Index cache file (default: <traces-root>/{INDEX_CACHE_NAME})")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the manifests")
+    parser.add_argument("--problem")
+    parser.add_argument("--persona")
+    parser.add_argument("--trace", help="Trace name (trace-01) or path")
+    parser.add_argument("--step", type=int)
+    parser.add_argument("--path", help="Snapshot path, e.g. life.py")
+    parser.add_argument("--changed", action="store_true", help="Only files changed in their step")
+    parser.add_argument("--final", action="store_true", help="Only each trace's last step")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    try:
+        index = CorpusIndex.load_or_build(args.traces_root, args.cache, rebuild=args.rebuild)
+    except CorpusIndexError as e:
+        raise SystemExit(f"error: {e}")
+    results = index.query(
+        problem=args.problem,
+        persona=args.persona,
+        trace=args.trace,
+        step=args.step,
+        path=args.path,
+        changed=True if args.changed else None,
+        final=args.final,
+    )
+    for snapshot in results:
+        if args.json:
+            location = snapshot.location().as_posix() if snapshot.encoding == "tree" else None
+            print(json.dumps({**snapshot._asdict(), "location": location}))
+        else:
+            print(f"{snapshot.problem}/{snapshot.persona}/{snapshot.trace}\tstep-{snapshot.step:02d}\t{snapshot.path}\t{snapshot.sha256[:12]}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
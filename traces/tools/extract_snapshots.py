@@ -2,13 +2,25 @@
 from __future__ import annotations
 
 import argparse
+import cProfile
+import fnmatch
+import hashlib
+import itertools
 import json
 import os
 import re
-import shutil
-from dataclasses import dataclass, field
+import sys
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator
+
+from blob_store import BlobStore, hash_bytes
+from snapshot_delta import Delta, delta_output_root, deltas_file, encode_delta, split_lines
+from snapshot_pack import PackWriter, pack_path_for, read_pack_header
+from timings import NO_TIMINGS, Timings
+from tree_writer import TreeWriter, WriteStats
 
 
 STEP_HEADING_RE = re.compile(r"^(#{2,3})\s+Step\s+(\d+)\s*(?:[:–—-]\s*(.*))?\s*$")
@@ -16,6 +28,12 @@ SNAPSHOT_LINE_RE = re.compile(r"^Snapshot:\s+(.+?)\s*$")
 FENCE_START_RE = re.compile(r"^```(?:\w+)?\s*$")
 FENCE_END_RE = re.compile(r"^```\s*$")
 
+BLOB_STORE_DIRNAME = "snapshots-store"
+
+# Bump whenever the snapshot layout or manifest format changes so that
+# incremental runs rebuild output written by an older extractor.
+EXTRACTOR_VERSION = 2
+
 
 @dataclass
 class Step:
@@ -24,11 +42,78 @@ class Step:
     snapshots: dict[str, str] = field(default_factory=dict)
 
 
-def iter_trace_files(traces_root: Path) -> Iterable[Path]:
-    for path in traces_root.rglob("trace-*.md"):
-        if "/snapshots/" in path.as_posix():
+@dataclass(frozen=True)
+class ExtractOptions:
+    write_full_state: bool
+    # How existing output is replaced, see tree_writer.STRATEGIES.
+    strategy: str = "clean"
+    force: bool = False
+    store_root: Path | None = None
+    # "tree": snapshots/<trace>/{full-state,changed-only}/step-NN/...
+    # "delta": snapshots/<trace>/delta/, see snapshot_delta.py
+    # "pack": one snapshots/<trace>.pack file per trace, see snapshot_pack.py
+    output_format: str = "tree"
+    # Tree format only: write full-state and changed-only from one parse.
+    both_layouts: bool = False
+    profile: bool = False
+
+    @property
+    def layouts(self) -> tuple[bool, ...]:
+        # write_full_state of every tree layout this run writes.
+        return (True, False) if self.both_layouts else (self.write_full_state,)
+
+
+@dataclass
+class ExtractResult:
+    trace_path: Path
+    # None when the trace has no steps.
+    manifest: dict | None
+    # True when the existing output was already up to date.
+    skipped: bool = False
+    stats: WriteStats = field(default_factory=WriteStats)
+    timings: Timings = field(default_factory=lambda: Timings(enabled=False))
+
+
+# Directory names that hold extractor output rather than traces. Discovery
+# never descends into them, so its cost does not grow with extracted output.
+OUTPUT_DIRNAMES = frozenset({"snapshots", BLOB_STORE_DIRNAME})
+
+
+def scan_trace_entries(traces_root: Path, *, skip_dirs: Iterable[str] = OUTPUT_DIRNAMES) -> Iterator[os.DirEntry]:
+    # Traces live at <problem>/<persona>/trace-NN.md, but any depth works.
+    # Output directories are pruned before they are opened, and symlinked
+    # directories are not followed.
+    skip_dirs = frozenset(skip_dirs)
+    pending = [os.fspath(traces_root)]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
             continue
-        yield path
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in skip_dirs:
+                        pending.append(entry.path)
+                elif fnmatch.fnmatchcase(entry.name, "trace-*.md") and entry.is_file():
+                    yield entry
+
+
+def iter_trace_files(traces_root: Path, *, skip_dirs: Iterable[str] = OUTPUT_DIRNAMES) -> Iterable[Path]:
+    for entry in scan_trace_entries(traces_root, skip_dirs=skip_dirs):
+        yield Path(entry.path)
+
+
+def stat_key(path: Path | os.DirEntry) -> tuple[int, int]:
+    # (mtime_ns, size): how the tools tell whether a file changed since they read it.
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+
+def scan_trace_stats(traces_root: Path) -> dict[Path, tuple[int, int]]:
+    # stat_key of every trace file, for --watch change detection.
+    return {Path(entry.path): stat_key(entry) for entry in scan_trace_entries(traces_root)}
 
 
 def safe_rel_path(raw: str) -> Path:
@@ -43,23 +128,35 @@ def safe_rel_path(raw: str) -> Path:
     return candidate
 
 
-def parse_trace_markdown(trace_path: Path) -> list[Step]:
-    lines = trace_path.read_text(encoding="utf-8").splitlines()
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    steps: list[Step] = []
-    current_step: Step | None = None
 
-    i = 0
-    while i < len(lines):
-        line = lines[i]
+def iter_trace_lines(trace_path: Path) -> Iterator[str]:
+    # Same line boundaries as read_text().splitlines(), one physical line at a time.
+    with trace_path.open(encoding="utf-8") as f:
+        for raw in f:
+            yield from raw.splitlines()
+
 
+def iter_document_steps(trace_path: Path, lines: Iterable[str]) -> Iterator[Step]:
+    # Steps in the order they appear in the document. Only the step being read
+    # is held in memory.
+    current_step: Step | None = None
+    line_iter = iter(lines)
+
+    for line in line_iter:
         heading_match = STEP_HEADING_RE.match(line)
         if heading_match:
+            if current_step is not None:
+                yield current_step
             step_no = int(heading_match.group(2))
             step_title = (heading_match.group(3) or "").strip()
             current_step = Step(number=step_no, title=step_title)
-            steps.append(current_step)
-            i += 1
             continue
 
         snapshot_match = SNAPSHOT_LINE_RE.match(line)
@@ -69,28 +166,42 @@ def parse_trace_markdown(trace_path: Path) -> list[Step]:
 
             rel_path = safe_rel_path(snapshot_match.group(1))
 
-            j = i + 1
-            while j < len(lines) and lines[j].strip() == "":
-                j += 1
-
-            if j >= len(lines) or not FENCE_START_RE.match(lines[j]):
+            fence_line = next((candidate for candidate in line_iter if candidate.strip() != ""), None)
+            if fence_line is None or not FENCE_START_RE.match(fence_line):
                 raise ValueError(f"{trace_path}: Snapshot for {rel_path} missing fenced code block")
 
-            j += 1
             content_lines: list[str] = []
-            while j < len(lines) and not FENCE_END_RE.match(lines[j]):
-                content_lines.append(lines[j])
-                j += 1
-
-            if j >= len(lines):
+            for line in line_iter:
+                if FENCE_END_RE.match(line):
+                    break
+                content_lines.append(line)
+            else:
                 raise ValueError(f"{trace_path}: Snapshot for {rel_path} missing closing fence")
 
             current_step.snapshots[rel_path.as_posix()] = "\n".join(content_lines).rstrip() + "\n"
-            i = j + 1
-            continue
 
-        i += 1
+    if current_step is not None:
+        yield current_step
+
+
+class StepOrderError(Exception):
+    """A trace's step numbers go backwards, so it cannot be streamed in order."""
+
 
+def iter_trace_steps(trace_path: Path) -> Iterator[Step]:
+    # Streaming equivalent of parse_trace_markdown for traces whose steps are in
+    # order, in a single pass. A step numbered lower than the one before it
+    # raises StepOrderError; the caller then falls back to parse_trace_markdown.
+    previous: int | None = None
+    for step in iter_document_steps(trace_path, iter_trace_lines(trace_path)):
+        if previous is not None and step.number < previous:
+            raise StepOrderError(f"{trace_path}: step {step.number} follows step {previous}")
+        previous = step.number
+        yield step
+
+
+def parse_trace_markdown(trace_path: Path) -> list[Step]:
+    steps = iter_document_steps(trace_path, iter_trace_lines(trace_path))
     return sorted(steps, key=lambda s: s.number)
 
 
@@ -101,30 +212,178 @@ def trace_output_root(trace_path: Path, *, write_full_state: bool) -> Path:
     return trace_path.parent / "snapshots" / trace_path.stem / mode
 
 
-def write_snapshots(trace_path: Path, steps: list[Step], *, write_full_state: bool, clean: bool) -> dict:
-    out_root = trace_output_root(trace_path, write_full_state=write_full_state)
-    if clean and out_root.exists():
-        shutil.rmtree(out_root)
-    out_root.mkdir(parents=True, exist_ok=True)
+def write_snapshots(
+    trace_path: Path,
+    steps: Iterable[Step],
+    *,
+    write_full_state: bool,
+    strategy: str = "clean",
+    source_sha256: str | None = None,
+    store: BlobStore | None = None,
+    stats: WriteStats | None = None,
+    timings: Timings = NO_TIMINGS,
+) -> dict:
+    (manifest,) = write_layouts(
+        trace_path,
+        steps,
+        layouts=(write_full_state,),
+        strategy=strategy,
+        source_sha256=source_sha256,
+        store=store,
+        stats=stats,
+        timings=timings,
+    )
+    return manifest
+
+
+def write_layouts(
+    trace_path: Path,
+    steps: Iterable[Step],
+    *,
+    layouts: tuple[bool, ...] = (True, False),
+    strategy: str = "clean",
+    source_sha256: str | None = None,
+    store: BlobStore | None = None,
+    stats: WriteStats | None = None,
+    timings: Timings = NO_TIMINGS,
+) -> list[dict]:
+    # Writes one output tree and manifest per entry of `layouts` (True for
+    # full-state, False for changed-only) from a single pass over `steps`.
+    # Without a blob store, changed-only files are hardlinked to the
+    # full-state file of the same step when both layouts are written.
+    if source_sha256 is None:
+        source_sha256 = hash_file(trace_path)
+    out_roots = [trace_output_root(trace_path, write_full_state=full) for full in layouts]
+    writers = [TreeWriter(out_root, strategy, timings=timings) for out_root in out_roots]
+    full_writer = next((writer for writer, full in zip(writers, layouts) if full), None)
+    # A --check run only compares file contents: it never fills the store or links.
+    share = strategy != "check"
+
+    state: dict[str, str] = {}
+    state_hashes: dict[str, str] = {}
+    manifest_steps: list[list[dict]] = [[] for _ in layouts]
+
+    for step in steps:
+        changed_files = sorted(step.snapshots.keys())
+        for rel_path, content in step.snapshots.items():
+            state[rel_path] = content
+            state_hashes[rel_path] = hash_bytes(content.encode("utf-8"))
+
+        step_dir = Path(f"step-{step.number:02d}")
+        # Full-state first, so its files exist when changed-only links to them.
+        for writer, full, layout_steps in sorted(zip(writers, layouts, manifest_steps), key=lambda t: not t[1]):
+            writer.mkdir(step_dir)
+            files_to_write = state.items() if full else [(p, state[p]) for p in changed_files]
+            wrote_files: list[str] = []
+            for rel_path_str, content in files_to_write:
+                rel_path = safe_rel_path(rel_path_str)
+                if store is not None and share:
+                    digest = store.put(content.encode("utf-8"), state_hashes[rel_path_str])
+                    writer.link_blob(step_dir / rel_path, store, digest)
+                elif not full and full_writer is not None and share:
+                    writer.link_file(step_dir / rel_path, full_writer.root / step_dir / rel_path)
+                else:
+                    writer.write_text(step_dir / rel_path, content)
+                wrote_files.append(rel_path.as_posix())
+
+            layout_steps.append(
+                {
+                    "number": step.number,
+                    "title": step.title,
+                    "changed_files": changed_files,
+                    "written_files": sorted(wrote_files),
+                    "all_files": sorted(state.keys()),
+                    "file_hashes": {p: state_hashes[p] for p in sorted(state_hashes)},
+                }
+            )
+
+    manifests = []
+    for writer, full, out_root, layout_steps in zip(writers, layouts, out_roots, manifest_steps):
+        manifest = {
+            "trace": trace_path.as_posix(),
+            "output_root": out_root.as_posix(),
+            "write_full_state": full,
+            "source_sha256": source_sha256,
+            "extractor_version": EXTRACTOR_VERSION,
+            "blob_store": store.root.as_posix() if store is not None else None,
+            "steps": layout_steps,
+        }
+        writer.write_text("manifest.json", json.dumps(manifest, indent=2) + "\n")
+        finished = writer.finish()
+        if stats is not None:
+            stats.add(finished)
+        manifests.append(manifest)
+    return manifests
+
+
+def write_delta_snapshots(
+    trace_path: Path,
+    steps: Iterable[Step],
+    *,
+    strategy: str = "clean",
+    source_sha256: str | None = None,
+    stats: WriteStats | None = None,
+    timings: Timings = NO_TIMINGS,
+) -> dict:
+    # Like changed-only output, but a file that already existed at the previous
+    # step is stored as a line delta (deltas/step-NN.json) against that version
+    # whenever the delta is smaller than the file. snapshot_delta.materialize()
+    # rebuilds any file at any step from this layout.
+    if source_sha256 is None:
+        source_sha256 = hash_file(trace_path)
+    out_root = delta_output_root(trace_path)
+    writer = TreeWriter(out_root, strategy, timings=timings)
 
     state: dict[str, str] = {}
+    state_hashes: dict[str, str] = {}
     manifest_steps: list[dict] = []
+    # Contents as of the previous distinct step number; repeated step numbers
+    # share one step directory, so their deltas are taken against the same base.
+    base: dict[str, str] = {}
+    pending_deltas: dict[str, Delta] = {}
+    prev_number: int | None = None
+
+    def flush_deltas() -> None:
+        if prev_number is not None and pending_deltas:
+            writer.write_text(
+                deltas_file(out_root, prev_number).relative_to(out_root),
+                json.dumps(pending_deltas, separators=(",", ":")) + "\n",
+            )
 
     for step in steps:
+        if step.number != prev_number:
+            flush_deltas()
+            base = dict(state)
+            pending_deltas = {}
+            prev_number = step.number
+
         changed_files = sorted(step.snapshots.keys())
         for rel_path, content in step.snapshots.items():
             state[rel_path] = content
+            state_hashes[rel_path] = hash_bytes(content.encode("utf-8"))
 
-        step_dir = out_root / f"step-{step.number:02d}"
-        step_dir.mkdir(parents=True, exist_ok=True)
+        step_dir = Path(f"step-{step.number:02d}")
+        writer.mkdir(step_dir)
 
-        files_to_write = state.items() if write_full_state else [(p, state[p]) for p in changed_files]
+        encodings: dict[str, str] = {}
         wrote_files: list[str] = []
-        for rel_path_str, content in files_to_write:
+        for rel_path_str in changed_files:
+            content = state[rel_path_str]
+            delta: Delta | None = None
+            if rel_path_str in base:
+                delta = encode_delta(split_lines(base[rel_path_str]), split_lines(content))
+                if len(json.dumps(delta, separators=(",", ":"))) >= len(content):
+                    delta = None
+
+            if delta is not None:
+                pending_deltas[rel_path_str] = delta
+                encodings[rel_path_str] = "delta"
+                continue
+
             rel_path = safe_rel_path(rel_path_str)
-            target = step_dir / rel_path
-            target.parent.mkdir(parents=True, exist_ok=True)
-            target.write_text(content, encoding="utf-8")
+            writer.write_text(step_dir / rel_path, content)
+            pending_deltas.pop(rel_path_str, None)
+            encodings[rel_path_str] = "full"
             wrote_files.append(rel_path.as_posix())
 
         manifest_steps.append(
@@ -134,19 +393,384 @@ def write_snapshots(trace_path: Path, steps: list[Step], *, write_full_state: bo
                 "changed_files": changed_files,
                 "written_files": sorted(wrote_files),
                 "all_files": sorted(state.keys()),
+                "file_hashes": {p: state_hashes[p] for p in sorted(state_hashes)},
+                "encodings": encodings,
             }
         )
+    flush_deltas()
 
     manifest = {
         "trace": trace_path.as_posix(),
         "output_root": out_root.as_posix(),
-        "write_full_state": write_full_state,
+        "write_full_state": False,
+        "encoding": "delta",
+        "source_sha256": source_sha256,
+        "extractor_version": EXTRACTOR_VERSION,
+        "blob_store": None,
         "steps": manifest_steps,
     }
-    (out_root / "manifest.json").write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    writer.write_text("manifest.json", json.dumps(manifest, indent=2) + "\n")
+    finished = writer.finish()
+    if stats is not None:
+        stats.add(finished)
     return manifest
 
 
+def write_pack_snapshots(trace_path: Path, steps: Iterable[Step], *, source_sha256: str | None = None) -> dict:
+    # One file per trace indexing the full workspace at every step; each
+    # distinct file body is stored once. Returns the pack header minus its
+    # entry index, which doubles as the trace's manifest.
+    if source_sha256 is None:
+        source_sha256 = hash_file(trace_path)
+    pack_path = pack_path_for(trace_path)
+    writer = PackWriter(pack_path)
+
+    state: dict[str, bytes] = {}
+    state_hashes: dict[str, str] = {}
+    manifest_steps: list[dict] = []
+
+    for step in steps:
+        changed_files = sorted(step.snapshots.keys())
+        for rel_path, content in step.snapshots.items():
+            state[rel_path] = content.encode("utf-8")
+            state_hashes[rel_path] = hash_bytes(state[rel_path])
+
+        for rel_path in sorted(state):
+            writer.add(step.number, rel_path, state[rel_path], state_hashes[rel_path])
+
+        manifest_steps.append(
+            {
+                "number": step.number,
+                "title": step.title,
+                "changed_files": changed_files,
+                "all_files": sorted(state.keys()),
+            }
+        )
+
+    manifest = {
+        "trace": trace_path.as_posix(),
+        "output_root": pack_path.as_posix(),
+        "write_full_state": True,
+        "encoding": "pack",
+        "source_sha256": source_sha256,
+        "extractor_version": EXTRACTOR_VERSION,
+        "blob_store": None,
+        "steps": manifest_steps,
+    }
+    writer.finish(manifest)
+    return manifest
+
+
+def load_manifest(out_root: Path) -> dict | None:
+    manifest_path = out_root / "manifest.json"
+    try:
+        return json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def load_existing_manifests(trace_path: Path, options: ExtractOptions) -> list[dict | None]:
+    # One manifest per output this run would write.
+    if options.output_format == "pack":
+        try:
+            header = read_pack_header(pack_path_for(trace_path))
+        except (FileNotFoundError, ValueError):
+            return [None]
+        header.pop("entries", None)
+        return [header]
+    if options.output_format == "delta":
+        return [load_manifest(delta_output_root(trace_path))]
+    return [load_manifest(trace_output_root(trace_path, write_full_state=full)) for full in options.layouts]
+
+
+def is_up_to_date(manifest: dict | None, trace_path: Path, source_sha256: str, options: ExtractOptions) -> bool:
+    store_root = options.store_root.as_posix() if options.store_root is not None else None
+    return (
+        manifest is not None
+        and manifest.get("trace") == trace_path.as_posix()
+        and manifest.get("source_sha256") == source_sha256
+        and manifest.get("extractor_version") == EXTRACTOR_VERSION
+        and manifest.get("blob_store") == store_root
+    )
+
+
+def extract_trace(trace_path: Path, options: ExtractOptions) -> ExtractResult:
+    timings = Timings(enabled=options.profile)
+    result = ExtractResult(trace_path, None, timings=timings)
+    trace_size = trace_path.stat().st_size
+
+    with timings.phase("hash"):
+        source_sha256 = hash_file(trace_path)
+    timings.count("bytes_read", trace_size)
+    if not options.force and options.strategy != "check":
+        with timings.phase("check"):
+            manifests = load_existing_manifests(trace_path, options)
+        if all(is_up_to_date(manifest, trace_path, source_sha256, options) for manifest in manifests):
+            result.manifest = manifests[0]
+            result.skipped = True
+            return result
+
+    # Steps are streamed in one pass. Out-of-order step numbers only show up
+    # mid-stream; such a trace is then read again, sorted, and its output
+    # written again from the start (writers only merge stats when they finish).
+    timings.count("bytes_read", trace_size)
+    try:
+        write_output(result, iter_trace_steps(trace_path), options, source_sha256)
+    except StepOrderError:
+        timings.count("bytes_read", trace_size)
+        with timings.phase("parse"):
+            steps = parse_trace_markdown(trace_path)
+        write_output(result, iter(steps), options, source_sha256)
+    return result
+
+
+def write_output(result: ExtractResult, steps: Iterator[Step], options: ExtractOptions, source_sha256: str) -> None:
+    trace_path = result.trace_path
+    timings = result.timings
+    steps = timings.timed_iter("parse", steps)
+    first_step = next(steps, None)
+    if first_step is None:
+        return
+    steps = itertools.chain([first_step], steps)
+    with timings.phase("build"):
+        if options.output_format == "pack":
+            result.manifest = write_pack_snapshots(trace_path, steps, source_sha256=source_sha256)
+            result.stats.written += 1
+            result.stats.bytes_written += pack_path_for(trace_path).stat().st_size
+        elif options.output_format == "delta":
+            result.manifest = write_delta_snapshots(
+                trace_path,
+                steps,
+                strategy=options.strategy,
+                source_sha256=source_sha256,
+                stats=result.stats,
+                timings=timings,
+            )
+        else:
+            result.manifest = write_layouts(
+                trace_path,
+                steps,
+                layouts=options.layouts,
+                strategy=options.strategy,
+                source_sha256=source_sha256,
+                store=BlobStore(options.store_root) if options.store_root is not None else None,
+                stats=result.stats,
+                timings=timings,
+            )[0]
+
+
+def extract_all(
+    trace_paths: list[Path], options: ExtractOptions, *, jobs: int, keep_going: bool = False
+) -> list[ExtractResult]:
+    # One result per trace, in the order of `trace_paths` regardless of which
+    # worker finishes first, so the summary is identical to a serial run. With
+    # `keep_going`, a trace that fails is reported and left out of the results
+    # instead of ending the run.
+    if jobs <= 1:
+        results = []
+        for trace_path in trace_paths:
+            try:
+                results.append(extract_trace(trace_path, options))
+            except Exception as e:
+                if not keep_going:
+                    raise SystemExit(f"error: failed to extract {trace_path}: {e}") from e
+                print(f"error: failed to extract {trace_path}: {e}", file=sys.stderr, flush=True)
+        return results
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(extract_trace, trace_path, options): trace_path
+            for trace_path in trace_paths
+        }
+        if not keep_going:
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                e = future.exception()
+                if e is not None:
+                    # shutdown(cancel_futures=True) needs Python 3.9.
+                    for pending in futures:
+                        pending.cancel()
+                    raise SystemExit(f"error: failed to extract {futures[future]}: {e}") from e
+        results = []
+        for future, trace_path in futures.items():
+            e = future.exception()
+            if e is None:
+                results.append(future.result())
+            else:
+                print(f"error: failed to extract {trace_path}: {e}", file=sys.stderr, flush=True)
+        return results
+
+
+def format_stats(stats: WriteStats) -> str:
+    return f"{stats.written} written, {stats.skipped} unchanged, {stats.removed} removed"
+
+
+def profile_report(run: Timings, results: list[ExtractResult], *, jobs: int) -> dict:
+    # `run` holds the main process's phases; trace phases are summed over all
+    # traces (and therefore over all workers when --jobs > 1).
+    trace_phases = Timings()
+    stats = WriteStats()
+    for result in results:
+        trace_phases.add(result.timings)
+        stats.add(result.stats)
+    return {
+        "jobs": jobs,
+        "run": run.as_dict(),
+        "trace_phases": trace_phases.as_dict(),
+        "files": asdict(stats),
+        "traces": [
+            {
+                "trace": result.trace_path.as_posix(),
+                "skipped": result.skipped,
+                **result.timings.as_dict(),
+                "files": asdict(result.stats),
+            }
+            for result in results
+        ],
+    }
+
+
+def print_profile_report(report: dict, *, slowest: int = 5) -> None:
+    def rows(section: dict) -> None:
+        for name, phase in section["phases"].items():
+            print(f"  {name:<10} {phase['wall_seconds']:>9.4f}s wall {phase['cpu_seconds']:>9.4f}s cpu", file=sys.stderr)
+
+    print(f"profile: {len(report['traces'])} traces, --jobs {report['jobs']}", file=sys.stderr)
+    print(f"run phases (main process, {report['run']['wall_seconds']:.4f}s wall):", file=sys.stderr)
+    rows(report["run"])
+    print(f"trace phases (summed over traces, {report['trace_phases']['wall_seconds']:.4f}s wall):", file=sys.stderr)
+    rows(report["trace_phases"])
+    counters = report["trace_phases"]["counters"]
+    files = report["files"]
+    print(
+        f"bytes read {counters.get('bytes_read', 0)}, bytes written {files['bytes_written']}, "
+        f"mkdir calls {counters.get('mkdir_calls', 0)}, files {files['written']} written / "
+        f"{files['skipped']} unchanged / {files['removed']} removed",
+        file=sys.stderr,
+    )
+    traces = sorted(report["traces"], key=lambda t: t["wall_seconds"], reverse=True)[:slowest]
+    print("slowest traces:", file=sys.stderr)
+    for trace in traces:
+        print(f"  {trace['wall_seconds']:>9.4f}s wall {trace['cpu_seconds']:>9.4f}s cpu  {trace['trace']}", file=sys.stderr)
+
+
+def summary_path_for(traces_root: Path) -> Path:
+    return traces_root / "snapshots-summary.json"
+
+
+def build_summary(traces_root: Path, manifests: Iterable[dict | None]) -> dict:
+    # Trace paths relative to the traces root, so the summary does not
+    # depend on the directory the extractor ran in.
+    traces = [Path(os.path.relpath(m["trace"], traces_root)).as_posix() for m in manifests if m is not None]
+    return {
+        "count": len(traces),
+        "traces": traces,
+    }
+
+
+def write_summary(traces_root: Path, manifests: Iterable[dict | None]) -> dict:
+    # Left untouched when unchanged: a newer summary makes corpus_index
+    # rebuild its cache.
+    summary = build_summary(traces_root, manifests)
+    summary_path = summary_path_for(traces_root)
+    text = json.dumps(summary, indent=2) + "\n"
+    try:
+        unchanged = summary_path.read_text(encoding="utf-8") == text
+    except FileNotFoundError:
+        unchanged = False
+    if not unchanged:
+        summary_path.write_text(text, encoding="utf-8")
+    return summary
+
+
+def report_check(traces_root: Path, results: list[ExtractResult], *, check_summary: bool, limit: int = 10) -> int:
+    # Prints the differences a --check run found, at most `limit` per trace.
+    out_of_date = 0
+    matched = 0
+    for result in results:
+        matched += result.stats.skipped
+        mismatches = result.stats.mismatches
+        if not mismatches:
+            continue
+        out_of_date += 1
+        snapshots_dir = result.trace_path.parent / "snapshots"
+        print(f"{result.trace_path}: {len(mismatches)} difference(s)")
+        for mismatch in mismatches[:limit]:
+            kind, path = mismatch.split(" ", 1)
+            print(f"  {kind:<8}{os.path.relpath(path, snapshots_dir)}")
+        if len(mismatches) > limit:
+            print(f"  ... and {len(mismatches) - limit} more")
+
+    summary_ok = True
+    if check_summary:
+        summary_path = summary_path_for(traces_root)
+        expected = json.dumps(build_summary(traces_root, (result.manifest for result in results)), indent=2) + "\n"
+        try:
+            summary_ok = summary_path.read_text(encoding="utf-8") == expected
+        except FileNotFoundError:
+            summary_ok = False
+        if not summary_ok:
+            print(f"{summary_path}: out of date")
+
+    print(f"{len(results)} traces checked, {out_of_date} out of date; {matched} files match")
+    return 0 if out_of_date == 0 and summary_ok else 1
+
+
+def watch(traces_root: Path, options: ExtractOptions, *, jobs: int, interval: float, debounce: float) -> int:
+    # Poll the trace files' stat info; once a burst of edits has settled for
+    # `debounce` seconds, re-extract only the traces that changed. Manifests of
+    # every other trace stay cached here, so a cycle costs O(changed traces)
+    # plus one stat per trace.
+    known = scan_trace_stats(traces_root)
+    # A trace that is broken right now (e.g. mid-edit) is reported like in
+    # later cycles; its last good output, if any, stays in the summary.
+    manifests: dict[Path, dict | None] = {
+        result.trace_path: result.manifest
+        for result in extract_all(sorted(known), options, jobs=jobs, keep_going=True)
+    }
+    for trace_path in sorted(set(known) - set(manifests)):
+        manifests[trace_path] = load_existing_manifests(trace_path, options)[0]
+    summary = write_summary(traces_root, (manifests[p] for p in sorted(manifests)))
+    print(f"watching {len(known)} traces under {traces_root} (Ctrl-C to stop)", flush=True)
+
+    try:
+        while True:
+            time.sleep(interval)
+            current = scan_trace_stats(traces_root)
+            if current == known:
+                continue
+            while True:
+                time.sleep(debounce)
+                settled = scan_trace_stats(traces_root)
+                if settled == current:
+                    break
+                current = settled
+
+            for trace_path in sorted(set(known) - set(current)):
+                manifests.pop(trace_path, None)
+                print(f"removed {trace_path}", flush=True)
+            for trace_path in sorted(p for p, stat in current.items() if known.get(p) != stat):
+                try:
+                    result = extract_trace(trace_path, options)
+                except Exception as e:
+                    print(f"error: failed to extract {trace_path}: {e}", file=sys.stderr, flush=True)
+                    continue
+                manifests[trace_path] = result.manifest
+                if result.manifest is None:
+                    print(f"skipped {trace_path} (no steps)", flush=True)
+                elif result.skipped:
+                    print(f"unchanged {trace_path}", flush=True)
+                else:
+                    print(f"extracted {trace_path} ({len(result.manifest['steps'])} steps, {format_stats(result.stats)})", flush=True)
+            known = current
+
+            manifest_list = [manifests[p] for p in sorted(manifests)]
+            if build_summary(traces_root, manifest_list) != summary:
+                summary = write_summary(traces_root, manifest_list)
+    except KeyboardInterrupt:
+        return 0
+
+
 def main(argv: list[str]) -> int:
     parser = argparse.ArgumentParser(
         description=(
@@ -159,39 +783,170 @@ def main(argv: list[str]) -> int:
         )
     )
     parser.add_argument("--traces-root", type=Path, default=Path("traces"))
-    parser.add_argument("--changed-only", action="store_true", help="Only write files changed in each step")
+    layouts = parser.add_mutually_exclusive_group()
+    layouts.add_argument("--changed-only", action="store_true", help="Only write files changed in each step")
+    layouts.add_argument(
+        "--both",
+        action="store_true",
+        help=(
+            "Write the full-state and changed-only layouts from a single parse; changed-only files "
+            "are hardlinks to their full-state copies (or to the blob store with --dedupe)"
+        ),
+    )
     parser.add_argument("--trace", type=Path, default=None, help="Extract only one trace file")
-    parser.add_argument(
+    strategies = parser.add_mutually_exclusive_group()
+    strategies.add_argument(
         "--no-clean",
         action="store_true",
         help="Do not delete existing output before writing",
     )
+    strategies.add_argument(
+        "--check",
+        action="store_true",
+        help=(
+            "Write nothing; verify that the existing output and manifests match the traces and exit "
+            "non-zero with a summary of the differences (runs on all CPUs unless --jobs is given)"
+        ),
+    )
+    strategies.add_argument(
+        "--sync",
+        action="store_true",
+        help=(
+            "Only write files that are new or whose content changed, and delete files that are no "
+            "longer part of the output (unchanged files keep their mtime)"
+        ),
+    )
+    formats = parser.add_mutually_exclusive_group()
+    formats.add_argument(
+        "--delta",
+        action="store_true",
+        help=(
+            "Write changed files to snapshots/<trace>/delta, storing later versions as line "
+            "deltas against the previous one (see snapshot_delta.py)"
+        ),
+    )
+    formats.add_argument(
+        "--pack",
+        action="store_true",
+        help=(
+            "Write one indexed snapshots/<trace>.pack file per trace instead of step directories "
+            "(see snapshot_pack.py, which can also export packs back to directories)"
+        ),
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help=(
+            f"Store each distinct file once under <traces-root>/{BLOB_STORE_DIRNAME} and "
+            "materialize snapshot files as links to it"
+        ),
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-extract every trace, even if its manifest says the output is up to date",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of worker processes to extract traces with (default: 1)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and re-extract traces as they are edited",
+    )
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between --watch scans (default: 0.5)")
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.3,
+        help="Seconds a burst of --watch changes must be quiet before extracting (default: 0.3)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print per-phase wall/CPU times, byte and file counts to stderr",
+    )
+    parser.add_argument(
+        "--timings-json",
+        type=Path,
+        default=None,
+        help="Write per-trace and per-phase timings as JSON to this path",
+    )
+    parser.add_argument(
+        "--cprofile",
+        type=Path,
+        default=None,
+        help="Dump cProfile stats for the run to this path (covers the main process only; use --jobs 1)",
+    )
     args = parser.parse_args(argv)
+    if args.watch and args.trace:
+        parser.error("--watch always watches the whole --traces-root")
+    if (args.delta or args.pack) and args.dedupe:
+        parser.error("--dedupe only applies to the step directory layout")
+    if (args.delta or args.pack) and args.both:
+        parser.error("--both only applies to the step directory layout")
+    if args.check and (args.pack or args.watch):
+        parser.error("--check verifies step directory and --delta output, once")
+    if args.jobs is None:
+        args.jobs = (os.cpu_count() or 1) if args.check else 1
 
     traces_root: Path = args.traces_root
-    if args.changed_only:
-        write_full_state = False
-    else:
-        write_full_state = True
-    clean = not args.no_clean
+    options = ExtractOptions(
+        write_full_state=not args.changed_only,
+        strategy="check" if args.check else "sync" if args.sync else "overwrite" if args.no_clean else "clean",
+        force=args.force,
+        store_root=traces_root / BLOB_STORE_DIRNAME if args.dedupe else None,
+        output_format="delta" if args.delta else "pack" if args.pack else "tree",
+        both_layouts=args.both,
+        profile=args.profile or args.timings_json is not None,
+    )
+
+    if args.jobs < 1:
+        raise SystemExit("error: --jobs must be at least 1")
 
-    trace_files = [args.trace] if args.trace else list(iter_trace_files(traces_root))
+    if args.watch:
+        return watch(traces_root, options, jobs=args.jobs, interval=args.interval, debounce=args.debounce)
+
+    profiler = cProfile.Profile() if args.cprofile is not None else None
+    if profiler is not None:
+        profiler.enable()
+
+    run = Timings(enabled=options.profile)
+    with run.phase("discover"):
+        trace_files = [args.trace] if args.trace else list(iter_trace_files(traces_root))
     if not trace_files:
         raise SystemExit(f"No trace files found under {traces_root}")
 
-    manifests = []
-    for trace_path in sorted(trace_files):
-        steps = parse_trace_markdown(trace_path)
-        if not steps:
-            continue
-        manifests.append(write_snapshots(trace_path, steps, write_full_state=write_full_state, clean=clean))
-
-    summary = {
-        "count": len(manifests),
-        "traces": [m["trace"] for m in manifests],
-    }
-    summary_path = traces_root / "snapshots-summary.json"
-    summary_path.write_text(json.dumps(summary, indent=2) + "\n", encoding="utf-8")
+    with run.phase("extract"):
+        results = extract_all(sorted(trace_files), options, jobs=args.jobs)
+    check_status = None
+    if args.check:
+        check_status = report_check(traces_root, results, check_summary=args.trace is None)
+    else:
+        with run.phase("summary"):
+            write_summary(traces_root, (result.manifest for result in results))
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+    if options.profile:
+        report = profile_report(run, results, jobs=args.jobs)
+        if args.timings_json is not None:
+            args.timings_json.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        if args.profile:
+            print_profile_report(report)
+    if check_status is not None:
+        return check_status
+
+    stats = WriteStats()
+    for result in results:
+        stats.add(result.stats)
+    extracted = sum(1 for result in results if result.manifest is not None and not result.skipped)
+    skipped = sum(1 for result in results if result.skipped)
+    print(f"{extracted} traces extracted, {skipped} up to date; files: {format_stats(stats)}")
     return 0
 
 
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import abc
+import asyncio
+import email.utils
+import json
+import random
+import time
+import urllib.parse
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+
+@dataclass(frozen=True)
+class WorkItem:
+    id: str
+    trace: str
+    step: int
+    prompt: str
+
+
+class BackendError(Exception):
+    def __init__(self, message: str, *, retryable: bool, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class Backend(abc.ABC):
+    """Where feedback comes from. Subclasses implement `evaluate`.
+
+    `evaluate` answers a batch of items with one feedback string each, in
+    order, or raises BackendError (retryable for overload and network
+    trouble, not for malformed requests).
+    """
+
+    def __init__(self, model: str, params: dict[str, object] | None = None) -> None:
+        self.model = model
+        self.params = dict(params or {})
+
+    @abc.abstractmethod
+    async def evaluate(self, batch: list[WorkItem]) -> list[str]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+async def _post_json(url: str, payload: dict, *, timeout: float) -> tuple[int, dict[str, str], bytes]:
+    # Plain HTTP/1.1 over asyncio streams, one connection per request.
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme != "http":
+        raise BackendError(f"unsupported URL {url}", retryable=False)
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    request = (
+        f"POST {parts.path or '/'} HTTP/1.1\r\n"
+        f"Host: {parts.netloc}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode("latin-1") + body
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(parts.hostname, parts.port or 80), timeout)
+    try:
+        writer.write(request)
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, data = raw.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        # The server closed the connection early or did not speak HTTP.
+        raise BackendError(f"malformed reply {status_line[:60]!r}", retryable=True) from None
+    return status, headers, data
+
+
+def _retry_after(value: str | None) -> float | None:
+    # Seconds to wait from a Retry-After header: a number of seconds or an
+    # HTTP date. Anything else is ignored.
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class HttpBackend(Backend):
+    """POSTs batches as JSON to a feedback endpoint (see feedback_stub.py)."""
+
+    def __init__(self, url: str, model: str, params: dict[str, object] | None = None, *, timeout: float = 60.0) -> None:
+        super().__init__(model, params)
+        self.url = url
+        self.timeout = timeout
+
+    async def evaluate(self, batch: list[WorkItem]) -> list[str]:
+        payload = {
+            "model": self.model,
+            "params": self.params,
+            "items": [{"id": item.id, "prompt": item.prompt} for item in batch],
+        }
+        try:
+            status, headers, body = await _post_json(self.url, payload, timeout=self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise BackendError(f"{type(e).__name__}: {e}", retryable=True) from e
+        if status != 200:
+            raise BackendError(
+                f"HTTP {status}",
+                retryable=status == 429 or status >= 500,
+                retry_after=_retry_after(headers.get("retry-after")),
+            )
+        try:
+            results = {result["id"]: result["feedback"] for result in json.loads(body)["results"]}
+        except (ValueError, IndexError, KeyError, TypeError) as e:
+            raise BackendError(f"malformed response body ({type(e).__name__}: {e})", retryable=True) from e
+        missing = [item.id for item in batch if item.id not in results]
+        if missing:
+            raise BackendError(f"no result for {missing[0]}", retryable=True)
+        return [results[item.id] for item in batch]
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int, error: BackendError, rng: random.Random) -> float:
+        # Full jitter, unless the backend said how long to wait.
+        if error.retry_after is not None:
+            return error.retry_after
+        return rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class RetryingBackend(Backend):
+    """Sends a batch to `backend` again after retryable errors, per `policy`.
+
+    Counts the requests made, the retries among them and the latency of
+    each successful one. Wrapped in a CachedBackend, only the cache misses
+    of a batch are retried, and they are looked up once.
+    """
+
+    def __init__(self, backend: Backend, policy: RetryPolicy = RetryPolicy(), *, seed: int = 0) -> None:
+        super().__init__(backend.model, backend.params)
+        self.backend = backend
+        self.policy = policy
+        self.requests = 0
+        self.retries = 0
+        self.latencies: list[float] = []
+        self._rng = random.Random(seed)
+
+    async def evaluate(self, batch: list[WorkItem]) -> list[str]:
+        for attempt in range(1, self.policy.attempts + 1):
+            start = time.monotonic()
+            self.requests += 1
+            try:
+                results = await self.backend.evaluate(batch)
+            except BackendError as e:
+                if not e.retryable or attempt == self.policy.attempts:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self.policy.delay(attempt, e, self._rng))
+                continue
+            self.latencies.append(time.monotonic() - start)
+            return results
+        raise AssertionError("unreachable")
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, in bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimitedBackend(Backend):
+    """Waits for a token from `bucket` before every request to `backend`."""
+
+    def __init__(self, backend: Backend, bucket: TokenBucket) -> None:
+        super().__init__(backend.model, backend.params)
+        self.backend = backend
+        self.bucket = bucket
+
+    async def evaluate(self, batch: list[WorkItem]) -> list[str]:
+        await self.bucket.acquire()
+        return await self.backend.evaluate(batch)
+
+    async def close(self) -> None:
+        await self.backend.close()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator
+
+from corpus_index import CorpusIndex, CorpusIndexError
+from feedback_backend import (
+    Backend,
+    BackendError,
+    HttpBackend,
+    RateLimitedBackend,
+    RetryingBackend,
+    RetryPolicy,
+    TokenBucket,
+    WorkItem,
+)
+from prompt_builder import POLICIES, build_contexts
+from response_cache import DEFAULT_MAX_BYTES, RESPONSE_CACHE_NAME, CachedBackend, ResponseCache
+from trace_index import load_step_index
+
+
+RESPONSES_NAME = "feedback-responses.jsonl"
+
+PROMPT_HEADER = (
+    "You are reviewing a student's programming session, recorded step by step below.\n"
+    "Give short, specific educational feedback on step {step} only.\n\n"
+)
+
+
+def build_prompt(prefix: str, step: int) -> str:
+    return PROMPT_HEADER.format(step=step) + prefix
+
+
+async def iter_work_items(
+    traces_root: Path,
+    *,
+    trace: Path | None = None,
+    skip: set[str] = frozenset(),
+    policy: str | None = None,
+) -> AsyncIterator[WorkItem]:
+    """One item per (trace, step): the trace's text up to the end of that step.
+
+    With a `policy` (see prompt_builder.POLICIES), the context is assembled
+    from the step narrations and snapshots instead of the raw markdown.
+    Traces are read one at a time as the consumer pulls items, so memory
+    stays flat however large the corpus is. Ids in `skip` are not yielded.
+    """
+    index = CorpusIndex.load_or_build(traces_root)
+    trace_paths = [Path(info.trace_path) for info in index.traces]
+    if trace is not None:
+        trace_paths = [p for p in trace_paths if p == trace]
+        if not trace_paths:
+            raise SystemExit(f"error: {trace} is not in the corpus index")
+    for trace_path in trace_paths:
+        if policy is not None:
+            contexts = await asyncio.to_thread(build_contexts, trace_path, policy)
+            for number, prompt in contexts.prompts():
+                item_id = f"{trace_path.as_posix()}#{number}"
+                if item_id not in skip:
+                    yield WorkItem(item_id, trace_path.as_posix(), number, prompt)
+            continue
+        step_index = await asyncio.to_thread(load_step_index, trace_path)
+        data = await asyncio.to_thread(trace_path.read_bytes)
+        for step in step_index["steps"]:
+            item_id = f"{trace_path.as_posix()}#{step['number']}"
+            if item_id in skip:
+                continue
+            prefix = data[: step["end"]].decode("utf-8")
+            yield WorkItem(item_id, trace_path.as_posix(), step["number"], build_prompt(prefix, step["number"]))
+
+
+@dataclass
+class EvalStats:
+    items: int = 0
+    failed: int = 0
+    requests: int = 0
+    retries: int = 0
+    latencies: list[float] = field(default_factory=list)
+
+    def summary(self, elapsed: float) -> str:
+        ordered = sorted(self.latencies)
+
+        def pct(p: float) -> float:
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+        return (
+            f"{self.items} items answered, {self.failed} failed, {self.requests} requests "
+            f"({self.retries} retries) in {elapsed:.2f}s ({self.items / elapsed if elapsed else 0:.1f} items/s); "
+            f"request latency p50 {pct(0.5) * 1000:.0f} ms, p95 {pct(0.95) * 1000:.0f} ms"
+        )
+
+
+class ResponseLog:
+    """Responses as JSON lines, appended as they arrive.
+
+    Ids answered in an earlier run (not those that failed) are skipped when
+    the run is resumed. A line cut short by an interrupted run is ignored.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.done: set[str] = set()
+        try:
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if "feedback" in record:
+                        self.done.add(record["id"])
+        except FileNotFoundError:
+            pass
+        self._file = None
+
+    def append(self, records: list[dict]) -> None:
+        if self._file is None:
+            self._file = self.path.open("a", encoding="utf-8")
+            # Start on a fresh line after a partial write.
+            if self._file.tell() and not self.path.read_bytes().endswith(b"\n"):
+                self._file.write("\n")
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+async def _next_batch(queue: asyncio.Queue, size: int, wait: float) -> tuple[list[WorkItem], bool]:
+    # Up to `size` items, waiting at most `wait` seconds after the first for
+    # the rest. The flag is set once the end-of-stream marker was seen.
+    first = await queue.get()
+    if first is None:
+        return [], True
+    batch = [first]
+    deadline = time.monotonic() + wait
+    while len(batch) < size:
+        try:
+            item = queue.get_nowait() if wait <= 0 else await asyncio.wait_for(queue.get(), deadline - time.monotonic())
+        except (asyncio.QueueEmpty, asyncio.TimeoutError):
+            break
+        if item is None:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+async def evaluate_corpus(
+    items: AsyncIterator[WorkItem],
+    backend: Backend,
+    log: ResponseLog,
+    *,
+    concurrency: int = 8,
+    batch_size: int = 1,
+    batch_wait: float = 0.05,
+) -> EvalStats:
+    """Send every item to `backend` and log the responses.
+
+    `concurrency` requests are in flight at most, each carrying up to
+    `batch_size` items; retries, rate limits and caching are up to the
+    backend (see RetryingBackend, RateLimitedBackend and
+    response_cache.CachedBackend). The queue between the corpus and the
+    workers is bounded, so items are read only as fast as they are answered.
+    Request counts and latencies are left to the caller.
+    """
+    stats = EvalStats()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * batch_size * 2)
+
+    async def produce() -> None:
+        async for item in items:
+            await queue.put(item)
+        await queue.put(None)
+
+    async def send(batch: list[WorkItem]) -> tuple[list[str] | None, str | None]:
+        try:
+            return await backend.evaluate(batch), None
+        except BackendError as e:
+            return None, str(e)
+
+    async def work() -> None:
+        while True:
+            batch, finished = await _next_batch(queue, batch_size, batch_wait)
+            if batch:
+                start = time.monotonic()
+                results, error = await send(batch)
+                latency = round(time.monotonic() - start, 4)
+                records = []
+                for i, item in enumerate(batch):
+                    record = {"id": item.id, "trace": item.trace, "step": item.step, "model": backend.model}
+                    if results is not None:
+                        record["feedback"] = results[i]
+                    else:
+                        record["error"] = error
+                    record["latency"] = latency
+                    records.append(record)
+                log.append(records)
+                if results is not None:
+                    stats.items += len(batch)
+                else:
+                    stats.failed += len(batch)
+            if finished:
+                # Let the other workers see the end of the stream too.
+                await queue.put(None)
+                return
+
+    producer = asyncio.create_task(produce())
+    try:
+        await asyncio.gather(*(work() for _ in range(concurrency)), producer)
+    finally:
+        producer.cancel()
+    return stats
+
+
+def parse_params(pairs: list[str]) -> dict[str, object]:
+    params: dict[str, object] = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"error: --param expects NAME=VALUE, got {pair!r}")
+        try:
+            params[name] = json.loads(value)
+        except json.JSONDecodeError:
+            params[name] = value
+    return params
+
+
+async def _take(items: AsyncIterator[WorkItem], limit: int) -> AsyncIterator[WorkItem]:
+    count = 0
+    async for item in items:
+        if count >= limit:
+            return
+        count += 1
+        yield item
+
+
+async def run(args: argparse.Namespace) -> int:
+    stub = None
+    if args.stub:
+        from feedback_stub import start_stub
+
+        stub = start_stub(latency=args.stub_latency, error_rate=args.stub_error_rate, max_rps=args.stub_max_rps)
+        url = stub.url
+    else:
+        url = args.backend
+    backend: Backend = HttpBackend(url, args.model, parse_params(args.param), timeout=args.timeout)
+    if args.rps:
+        backend = RateLimitedBackend(backend, TokenBucket(args.rps, args.burst))
+    # Every attempt waits for the rate limit; the cache is looked up once per
+    # batch, and only its misses are retried.
+    retrying = backend = RetryingBackend(backend, RetryPolicy(attempts=args.attempts))
+    cache = None
+    if not args.no_cache:
+        cache_path = args.cache if args.cache is not None else args.traces_root / RESPONSE_CACHE_NAME
+        cache = ResponseCache(
+            cache_path,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024),
+            ttl=args.cache_ttl * 86400 if args.cache_ttl is not None else None,
+            read_only=args.cache_read_only,
+        )
+        backend = CachedBackend(backend, cache)
+
+    output = args.output if args.output is not None else args.traces_root / RESPONSES_NAME
+    log = ResponseLog(output)
+    skipped = len(log.done)
+    policy = None if args.context == "raw" else args.context
+    items = iter_work_items(args.traces_root, trace=args.trace, skip=log.done, policy=policy)
+    if args.limit is not None:
+        items = _take(items, args.limit)
+    start = time.monotonic()
+    try:
+        stats = await evaluate_corpus(
+            items,
+            backend,
+            log,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            batch_wait=args.batch_wait,
+        )
+        stats.requests, stats.retries, stats.latencies = retrying.requests, retrying.retries, retrying.latencies
+    finally:
+        log.close()
+        await backend.close()
+        if cache is not None:
+            cache.close()
+        if stub is not None:
+            stub.shutdown()
+            stub.server_close()
+    print(f"{skipped} items answered by an earlier run, skipped")
+    print(stats.summary(time.monotonic() - start))
+    if stub is not None:
+        print(f"stub: {stub.requests} requests, {stub.refused} refused")
+    if cache is not None:
+        print(f"response cache: {cache.stats}")
+    return 1 if stats.failed else 0
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Ask a feedback model about every step of every trace (the trace up to that step) and append the "
+            f"answers to <traces-root>/{RESPONSES_NAME}. Re-running resumes where the last run stopped."
+        )
+    )
+    parser.add_argument("--traces-root", type=Path, default=Path("traces"))
+    parser.add_argument("--trace", type=Path, default=None, help="Only this trace")
+    parser.add_argument("--output", type=Path, default=None, help=f"Responses (default: <traces-root>/{RESPONSES_NAME})")
+    parser.add_argument(
+        "--context",
+        choices=("raw", *POLICIES),
+        default="raw",
+        help="What each request contains: the trace markdown up to the step (raw) or a prompt_builder.py context",
+    )
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many new items")
+    backend = parser.add_mutually_exclusive_group(required=True)
+    backend.add_argument("--backend", metavar="URL", help="Feedback endpoint, e.g. http://127.0.0.1:8765/v1/feedback")
+    backend.add_argument("--stub", action="store_true", help="Start a local stub model (see feedback_stub.py) and use it")
+    parser.add_argument("--model", default="stub-1")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE", help="Model parameter (JSON value)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at most")
+    parser.add_argument("--batch-size", type=int, default=1, help="Items per request")
+    parser.add_argument("--batch-wait", type=float, default=0.05, help="Seconds to wait for a batch to fill")
+    parser.add_argument("--rps", type=float, default=None, help="Requests per second, on average")
+    parser.add_argument("--burst", type=float, default=None, help="Requests allowed back to back (default: --rps)")
+    parser.add_argument("--attempts", type=int, default=5, help="Tries per request, with exponential backoff")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds per request")
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=None,
+        help=f"SQLite response cache keyed by model, parameters and prompt (default: <traces-root>/{RESPONSE_CACHE_NAME})",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Ask the model every time and leave the cache untouched")
+    parser.add_argument(
+        "--cache-read-only",
+        action="store_true",
+        help="Answer only from the cache, without changing it; steps it does not cover fail",
+    )
+    parser.add_argument("--cache-ttl", type=float, default=None, metavar="DAYS", help="Ignore responses older than this")
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=DEFAULT_MAX_BYTES / (1024 * 1024),
+        help="Evict least recently used responses beyond this size (default: %(default)g)",
+    )
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-max-rps", type=float, default=None)
+    args = parser.parse_args(argv)
+    if args.no_cache and args.cache_read_only:
+        raise SystemExit("error: --no-cache and --cache-read-only cannot be combined")
+    if args.concurrency < 1 or args.batch_size < 1 or args.attempts < 1:
+        raise SystemExit("error: --concurrency, --batch-size and --attempts must be >= 1")
+    try:
+        return asyncio.run(run(args))
+    except CorpusIndexError as e:
+        raise SystemExit(f"error: {e}")
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
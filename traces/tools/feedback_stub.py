@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+FEEDBACK_PATH = "/v1/feedback"
+
+
+def stub_feedback(model: str, prompt: str) -> str:
+    # Deterministic for a given prompt, so cached and fresh runs agree.
+    digest = hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+    lines = prompt.count("\n") + 1
+    return f"[{model}] Feedback on a {lines}-line context ({digest[:12]}): keep steps small and test each one."
+
+
+class StubServer(ThreadingHTTPServer):
+    """A stand-in for a feedback model, for offline load tests.
+
+    Answers POST /v1/feedback with one feedback string per item after
+    `latency` seconds (plus `per_item` seconds per item). A seeded fraction
+    `error_rate` of requests fail with 503, and requests beyond `max_rps` per
+    second are refused with 429 and a Retry-After header.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        *,
+        latency: float = 0.05,
+        per_item: float = 0.01,
+        error_rate: float = 0.0,
+        max_rps: float | None = None,
+        seed: int = 0,
+    ) -> None:
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.per_item = per_item
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.requests = 0
+        self.items = 0
+        self.refused = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{FEEDBACK_PATH}"
+
+    def admit(self) -> int:
+        # The status to answer with: 200, 429 (over max_rps) or 503.
+        with self._lock:
+            self.requests += 1
+            if self.max_rps is not None:
+                now = time.monotonic()
+                if now - self._window_start >= 1.0:
+                    self._window_start, self._window_count = now, 0
+                if self._window_count >= self.max_rps:
+                    self.refused += 1
+                    return 429
+                self._window_count += 1
+            if self._rng.random() < self.error_rate:
+                self.refused += 1
+                return 503
+            return 200
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StubServer
+
+    def do_POST(self) -> None:
+        if self.path != FEEDBACK_PATH:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            model, items = request["model"], request["items"]
+        except (ValueError, KeyError, TypeError):
+            self._reply(400, {"error": "expected JSON with model and items"})
+            return
+        status = self.server.admit()
+        if status == 429:
+            self._reply(429, {"error": "rate limited"}, {"Retry-After": "1"})
+            return
+        time.sleep(self.server.latency + self.server.per_item * len(items))
+        if status != 200:
+            self._reply(status, {"error": "overloaded"})
+            return
+        with self.server._lock:
+            self.server.items += len(items)
+        results = [{"id": item["id"], "feedback": stub_feedback(model, item["prompt"])} for item in items]
+        self._reply(200, {"model": model, "results": results})
+
+    def _reply(self, status: int, payload: dict, headers: dict[str, str] | None = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **options: object) -> StubServer:
+    # Serves from a daemon thread; call shutdown() to stop it.
+    server = StubServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Serve a local stand-in feedback model for feedback_eval.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per request")
+    parser.add_argument("--per-item", type=float, default=0.01, help="Extra seconds per item in a batch")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail with 503")
+    parser.add_argument("--max-rps", type=float, default=None, help="Refuse requests beyond this rate with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = StubServer(
+        (args.host, args.port),
+        latency=args.latency,
+        per_item=args.per_item,
+        error_rate=args.error_rate,
+        max_rps=args.max_rps,
+        seed=args.seed,
+    )
+    print(f"serving {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"{server.requests} requests, {server.items} items answered, {server.refused} refused")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
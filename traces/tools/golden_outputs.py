@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from blob_store import hash_bytes
+from result_cache import RESULT_CACHE_NAME, ResultCache, tree_digest
+from run_snapshots import ENTRY_COMMANDS, Job, Runner, RunResult, discover_jobs, run_all, run_command
+
+
+GOLDEN_NAME = "snapshots-golden.json"
+GOLDEN_VERSION = 1
+
+# Working copies live in fresh temp dirs; tracebacks mention them.
+_WORKDIR_RE = re.compile(re.escape(tempfile.gettempdir()) + r"/snapshot-run-[^/\s\"']+")
+
+# (script, command index, exit code, stdout sha256, stderr sha256) for one
+# acceptance command of one step.
+Outcome = Tuple[str, int, Optional[int], str, str]
+
+
+def normalize(text: str) -> str:
+    return _WORKDIR_RE.sub("<workdir>", text)
+
+
+def step_outcomes(job: Job, runs: list[RunResult], blobs: dict[str, str]) -> list[Outcome]:
+    outcomes = []
+    index_by_script: dict[str, int] = {}
+    for run in runs:
+        index = index_by_script.get(run.script, 0)
+        index_by_script[run.script] = index + 1
+        hashes = []
+        for text in (normalize(run.stdout), normalize(run.stderr)):
+            digest = hash_bytes(text.encode("utf-8"))
+            blobs.setdefault(digest, text)
+            hashes.append(digest)
+        outcomes.append((run.script, index, run.exit_code, hashes[0], hashes[1]))
+    return outcomes
+
+
+def run_distinct(
+    jobs: list[Job],
+    *,
+    workers: int,
+    timeout: float,
+    runner: Runner = run_command,
+    cache: ResultCache | None = None,
+) -> list[list[RunResult]]:
+    # Steps whose working copies are identical (the same snapshot files at
+    # consecutive steps, or in several personas) run once; the result cache
+    # extends that across invocations.
+    representatives: dict[tuple, int] = {}
+    distinct: list[Job] = []
+    slots = []
+    for job in jobs:
+        key = (tree_digest(job.input_hashes), job.targets)
+        if key not in representatives:
+            representatives[key] = len(distinct)
+            distinct.append(job)
+        slots.append(representatives[key])
+    reports = run_all(distinct, workers=workers, timeout=timeout, runner=runner, cache=cache)
+    return [reports[slot].runs for slot in slots]
+
+
+def record(jobs: list[Job], results: list[list[RunResult]]) -> dict:
+    blobs: dict[str, str] = {}
+    traces: dict[str, dict[str, list]] = {}
+    for job, runs in zip(jobs, results):
+        steps = traces.setdefault(job.trace_path.as_posix(), {})
+        steps[str(job.step)] = [list(outcome) for outcome in step_outcomes(job, runs, blobs)]
+    return {
+        "version": GOLDEN_VERSION,
+        "python": sys.version.split()[0],
+        "commands": {script: [list(command.argv) for command in commands] for script, commands in ENTRY_COMMANDS.items()},
+        "outputs": dict(sorted(blobs.items())),
+        "traces": traces,
+    }
+
+
+def load_golden(path: Path) -> dict:
+    golden = json.loads(path.read_text(encoding="utf-8"))
+    if golden.get("version") != GOLDEN_VERSION:
+        raise SystemExit(f"error: {path}: unsupported golden file version")
+    return golden
+
+
+def expect_ok(script: str, index: int) -> bool:
+    return ENTRY_COMMANDS[script][index].expect_ok
+
+
+def describe(script: str, index: int) -> str:
+    return " ".join([script, *ENTRY_COMMANDS[script][index].argv])
+
+
+def step_changes(golden: dict) -> list[str]:
+    # One line per command whose result differs from the previous step's.
+    lines = []
+    for trace, steps in golden["traces"].items():
+        previous: dict[tuple[str, int], list] = {}
+        for step in sorted(steps, key=int):
+            for script, index, exit_code, out, err in steps[step]:
+                key = (script, index)
+                before = previous.get(key)
+                previous[key] = [exit_code, out, err]
+                if before is None or before == [exit_code, out, err]:
+                    continue
+                was_ok = (before[0] == 0) == expect_ok(script, index)
+                is_ok = (exit_code == 0) == expect_ok(script, index)
+                what = "BROKE" if was_ok and not is_ok else "fixed" if is_ok and not was_ok else "changed"
+                detail = []
+                if before[0] != exit_code:
+                    detail.append(f"exit {before[0]} -> {exit_code}")
+                if before[1] != out:
+                    detail.append("stdout")
+                if before[2] != err:
+                    detail.append("stderr")
+                lines.append(f"{trace} step {int(step):02d} {what:<8}{describe(script, index)} ({', '.join(detail)})")
+    return lines
+
+
+def first_divergence(steps: list[int], differs: Callable[[int], bool]) -> int | None:
+    """The first step for which `differs` is true, probing O(log n) steps.
+
+    Assumes that once a trace diverges it stays diverged, which holds for a
+    regression introduced at some step and carried forward by later ones.
+    """
+    lo, hi = 0, len(steps)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if differs(steps[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    return steps[lo] if lo < len(steps) else None
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run each problem's README acceptance commands against every step of every trace, "
+            "record the outputs, and find the steps where they change."
+        )
+    )
+    parser.add_argument("--traces-root", type=Path, default=Path("traces"))
+    parser.add_argument("--golden", type=Path, default=None, help=f"Recorded outputs (default: <traces-root>/{GOLDEN_NAME})")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--warm", action="store_true", help="Use the pre-warmed executor (see warm_executor.py)")
+    parser.add_argument("--no-cache", action="store_true", help=f"Do not use <traces-root>/{RESULT_CACHE_NAME}")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("record", help="Run every step and write the golden file, then print step-to-step changes")
+    sub.add_parser("changes", help="Print step-to-step changes from the golden file without running anything")
+    check = sub.add_parser("check", help="Run every step and report differences from the golden file")
+    check.add_argument("--trace", type=Path, default=None)
+    bisect = sub.add_parser(
+        "bisect",
+        help=(
+            "Find the first step of a trace whose output differs from the golden file "
+            "(or, with --from-first, from its own first step), running as few steps as possible"
+        ),
+    )
+    bisect.add_argument("trace", type=Path)
+    bisect.add_argument("--from-first", action="store_true")
+    args = parser.parse_args(argv)
+
+    golden_path = args.golden if args.golden is not None else args.traces_root / GOLDEN_NAME
+    if args.command == "changes":
+        for line in step_changes(load_golden(golden_path)):
+            print(line)
+        return 0
+
+    trace = getattr(args, "trace", None)
+    jobs = discover_jobs(args.traces_root, trace=trace, harness=False)
+    if not jobs:
+        raise SystemExit(f"No runnable snapshots found under {args.traces_root}")
+
+    with ExitStack() as stack:
+        cache = None if args.no_cache else stack.enter_context(ResultCache(args.traces_root / RESULT_CACHE_NAME))
+        runner: Runner = run_command
+        if args.warm:
+            from warm_executor import WarmExecutor
+
+            runner = stack.enter_context(WarmExecutor(args.jobs)).run_command
+
+        def run(selected: list[Job]) -> dict:
+            return record(selected, run_distinct(selected, workers=args.jobs, timeout=args.timeout, runner=runner, cache=cache))
+
+        if args.command == "record":
+            golden = run(jobs)
+            golden_path.write_text(json.dumps(golden, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+            for line in step_changes(golden):
+                print(line)
+            print(f"recorded {len(jobs)} steps, {len(golden['outputs'])} distinct outputs to {golden_path}")
+            return 0
+
+        if args.command == "check":
+            expected = load_golden(golden_path)["traces"]
+            current = run(jobs)["traces"]
+            differing = [
+                f"{trace_name} step {int(step):02d}"
+                for trace_name, steps in current.items()
+                for step, outcomes in steps.items()
+                if expected.get(trace_name, {}).get(step) != outcomes
+            ]
+            # Recorded steps that no longer run: the step or its trace is
+            # gone, or it stopped shipping a runnable entry.
+            if trace is not None:
+                expected = {name: steps for name, steps in expected.items() if name == trace.as_posix()}
+            missing = [
+                f"{trace_name} step {int(step):02d}"
+                for trace_name, steps in expected.items()
+                for step in sorted(steps, key=int)
+                if step not in current.get(trace_name, {})
+            ]
+            for line in differing:
+                print(f"differs {line}")
+            for line in missing:
+                print(f"missing {line}")
+            print(
+                f"{len(jobs)} steps checked, {len(differing)} differ from {golden_path}, "
+                f"{len(missing)} recorded steps missing"
+            )
+            return 1 if differing or missing else 0
+
+        # bisect: each probe runs a single step (memoized by the cache).
+        by_step = {job.step: job for job in jobs}
+        probed: dict[int, list] = {}
+
+        def outcome_at(step: int) -> list:
+            if step not in probed:
+                probed[step] = run([by_step[step]])["traces"][args.trace.as_posix()][str(step)]
+            return probed[step]
+
+        steps = sorted(by_step)
+        if args.from_first:
+            reference = outcome_at(steps[0])
+            found = first_divergence(steps, lambda step: outcome_at(step) != reference)
+        else:
+            recorded = load_golden(golden_path)["traces"].get(args.trace.as_posix(), {})
+            found = first_divergence(steps, lambda step: outcome_at(step) != recorded.get(str(step)))
+        probes = ", ".join(str(step) for step in sorted(probed))
+        if found is None:
+            print(f"{args.trace}: no step diverges (ran steps {probes})")
+        else:
+            print(f"{args.trace}: first diverging step is {found} (ran steps {probes})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+from pathlib import Path
+
+from ast_diff import FingerprintCache
+from corpus_index import CorpusIndex, CorpusIndexError, Snapshot
+
+
+MINHASH_CACHE_NAME = "snapshots-minhash-cache.json"
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+# 32 bands of 4 rows: pairs with Jaccard similarity 0.5 share a bucket with
+# probability ~0.87, pairs at 0.8 with probability >0.9999.
+BANDS = 32
+MINHASH_VERSION = f"1-k{SHINGLE_SIZE}-n{NUM_PERM}"
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(0)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def shingles(text: str, k: int = SHINGLE_SIZE) -> set[int]:
+    """32-bit hashes of every run of k tokens (words and punctuation marks).
+
+    Working on tokens rather than characters makes whitespace and line
+    wrapping irrelevant. Texts shorter than k tokens are one shingle.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    runs = [" ".join(tokens[i : i + k]) for i in range(max(1, len(tokens) - k + 1))] if tokens else []
+    return {int.from_bytes(hashlib.blake2b(run.encode("utf-8"), digest_size=4).digest(), "big") for run in runs}
+
+
+def minhash(text: str) -> dict:
+    # Cached per blob by FingerprintCache, hence the dict.
+    hashes = shingles(text)
+    if not hashes:
+        return {"signature": None, "shingles": 0}
+    signature = [min((a * h + b) % _MERSENNE for h in hashes) & _MAX_HASH for a, b in _PERMUTATIONS]
+    return {"signature": signature, "shingles": len(hashes)}
+
+
+def estimate_jaccard(a: list[int], b: list[int]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class LSHIndex:
+    """MinHash signatures bucketed by band, for sub-linear similarity queries.
+
+    A query only compares against signatures that agree with it on every
+    row of at least one band, instead of against the whole corpus. Entries
+    can be added at any time.
+    """
+
+    def __init__(self, bands: int = BANDS) -> None:
+        if NUM_PERM % bands:
+            raise ValueError(f"{bands} bands do not divide {NUM_PERM} permutations")
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.signatures: dict[str, list[int]] = {}
+        self._buckets: list[dict[tuple[int, ...], list[str]]] = [{} for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def _band_keys(self, signature: list[int]) -> list[tuple[int, ...]]:
+        return [tuple(signature[i * self.rows : (i + 1) * self.rows]) for i in range(self.bands)]
+
+    def add(self, key: str, signature: list[int]) -> None:
+        if key in self.signatures:
+            return
+        self.signatures[key] = signature
+        for buckets, band in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(band, []).append(key)
+
+    def candidates(self, signature: list[int]) -> set[str]:
+        found: set[str] = set()
+        for buckets, band in zip(self._buckets, self._band_keys(signature)):
+            found.update(buckets.get(band, ()))
+        return found
+
+    def query(self, signature: list[int], threshold: float) -> list[tuple[str, float]]:
+        """Entries whose estimated Jaccard similarity is at least `threshold`, most similar first."""
+        matches = []
+        for key in self.candidates(signature):
+            similarity = estimate_jaccard(signature, self.signatures[key])
+            if similarity >= threshold:
+                matches.append((key, similarity))
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def clusters(self, threshold: float) -> list[list[str]]:
+        # Connected components of the "at least `threshold` similar" graph.
+        parent = {key: key for key in self.signatures}
+
+        def find(key: str) -> str:
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for key, signature in self.signatures.items():
+            for other, _ in self.query(signature, threshold):
+                parent[find(other)] = find(key)
+        groups: dict[str, list[str]] = {}
+        for key in self.signatures:
+            groups.setdefault(find(key), []).append(key)
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=lambda g: (-len(g), g))
+
+
+def build_index(traces_root: Path, *, jobs: int = 1, bands: int = BANDS) -> tuple[LSHIndex, CorpusIndex, int]:
+    # (LSH index over every distinct blob, the corpus index, blobs hashed now)
+    corpus = CorpusIndex.load_or_build(traces_root)
+    sources = corpus.blob_locations()
+    cache = FingerprintCache(traces_root / MINHASH_CACHE_NAME, compute=minhash, version=MINHASH_VERSION)
+    computed = cache.fill(sources, jobs=jobs)
+    cache.save()
+    index = LSHIndex(bands)
+    for digest in sources:
+        signature = cache.fingerprints[digest]["signature"]
+        if signature is not None:
+            index.add(digest, signature)
+    return index, corpus, computed
+
+
+def describe_blob(snapshots: list[Snapshot]) -> str:
+    first = snapshots[0]
+    places = sorted({f"{s.problem}/{s.persona}" for s in snapshots})
+    more = f" (+{len(places) - 3} more)" if len(places) > 3 else ""
+    return f"{first.path} in {', '.join(places[:3])}{more}"
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Find near-duplicate snapshot files across traces, personas and problems with MinHash LSH. "
+            f"Signatures are cached per distinct file in <traces-root>/{MINHASH_CACHE_NAME}, so only new files "
+            "are hashed."
+        )
+    )
+    parser.add_argument("--traces-root", type=Path, default=Path("traces"))
+    parser.add_argument("--threshold", type=float, default=0.8, help="Minimum estimated Jaccard similarity")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Processes to hash new files with")
+    parser.add_argument("--similar", type=Path, default=None, help="List corpus files similar to this file instead")
+    parser.add_argument("--all", action="store_true", help="Include clusters within a single persona of a single problem")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+    if not 0 < args.threshold <= 1:
+        raise SystemExit("error: --threshold must be in (0, 1]")
+
+    try:
+        index, corpus, computed = build_index(args.traces_root, jobs=args.jobs)
+    except CorpusIndexError as e:
+        raise SystemExit(f"error: {e}")
+    by_blob: dict[str, list[Snapshot]] = {}
+    for snapshot in corpus.query():
+        by_blob.setdefault(snapshot.sha256, []).append(snapshot)
+
+    if args.similar is not None:
+        try:
+            signature = minhash(args.similar.read_text(encoding="utf-8"))["signature"]
+        except (OSError, UnicodeDecodeError) as e:
+            raise SystemExit(f"error: cannot read {args.similar}: {e}")
+        matches = index.query(signature, args.threshold) if signature is not None else []
+        if args.json:
+            print(json.dumps([{"sha256": key, "similarity": similarity} for key, similarity in matches], indent=2))
+        for key, similarity in [] if args.json else matches:
+            print(f"{similarity:.2f}  {key[:12]}  {describe_blob(by_blob[key])}")
+        return 0
+
+    clusters = []
+    for group in index.clusters(args.threshold):
+        places = {(s.problem, s.persona) for key in group for s in by_blob[key]}
+        if len(places) > 1 or args.all:
+            clusters.append(group)
+    if args.json:
+        payload = [
+            [{"sha256": key, "snapshots": [f"{s.trace_path}#{s.step}:{s.path}" for s in by_blob[key]]} for key in group]
+            for group in clusters
+        ]
+        print(json.dumps(payload, indent=2))
+        return 0
+    for number, group in enumerate(clusters, 1):
+        print(f"cluster {number} ({len(group)} files)")
+        for key in group:
+            print(f"  {key[:12]}  {describe_blob(by_blob[key])}")
+    print(
+        f"{len(index)} distinct files ({computed} hashed), {len(clusters)} clusters at Jaccard >= {args.threshold:g}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator
+
+from corpus_index import CorpusIndex, CorpusIndexError
+from trace_index import load_step_index, read_step
+
+
+POLICIES = ("full-state", "changed-only", "diffs")
+TOKEN_CACHE_NAME = "snapshots-token-cache.json"
+TOKEN_CACHE_VERSION = 1
+
+CONTEXT_INTRO = "You are reviewing a student's programming session, recorded step by step below.\n\n"
+CONTEXT_REQUEST = "\nGive short, specific educational feedback on step {step} only.\n"
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def approx_tokens(text: str) -> int:
+    # Words and punctuation marks; close enough to a BPE count to compare
+    # context policies, without a tokenizer dependency.
+    return len(_TOKEN_RE.findall(text))
+
+
+@dataclass(frozen=True)
+class Segment:
+    text: str
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+
+class TokenCounter:
+    """Token counts of segments, cached by content hash.
+
+    The same file body or narration recurs across steps, policies and
+    personas, so most segments are counted once. With a `path`, counts
+    persist between runs (per counter `name`).
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        *,
+        count: Callable[[str], int] = approx_tokens,
+        name: str = "approx",
+    ) -> None:
+        self.path = path
+        self.count = count
+        self.name = name
+        self.counts: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        if path is not None:
+            try:
+                payload = json.loads(path.read_text(encoding="utf-8"))
+                if (payload.get("version"), payload.get("counter")) == (TOKEN_CACHE_VERSION, name):
+                    self.counts = payload["counts"]
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                pass
+
+    def __call__(self, segment: Segment) -> int:
+        key = segment.key
+        tokens = self.counts.get(key)
+        if tokens is None:
+            self.misses += 1
+            tokens = self.counts[key] = self.count(segment.text)
+            self._dirty = True
+        else:
+            self.hits += 1
+        return tokens
+
+    def save(self) -> None:
+        if self.path is None or not self._dirty:
+            return
+        payload = {"version": TOKEN_CACHE_VERSION, "counter": self.name, "counts": self.counts}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(payload, separators=(",", ":")) + "\n", encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+def _file_segment(path: str, content: str, *, diff_against: str | None = None) -> Segment:
+    if not content.endswith("\n"):
+        content += "\n"
+    if diff_against is None:
+        return Segment(f"### {path}\n```\n{content}```\n\n")
+    diff = difflib.unified_diff(
+        diff_against.splitlines(keepends=True), content.splitlines(keepends=True), f"a/{path}", f"b/{path}", n=2
+    )
+    body = "".join(line if line.endswith("\n") else line + "\n" for line in diff)
+    return Segment(f"### {path} (diff)\n```diff\n{body}```\n\n")
+
+
+@dataclass
+class TraceContexts:
+    """The feedback contexts of every step of a trace, sharing one prefix.
+
+    The context for step k is the intro, then the segments that steps 1..k
+    appended, then a request naming step k. Nothing is copied per step:
+    `prompt(i)` joins the shared segments on demand.
+    """
+
+    trace: str
+    policy: str
+    intro: Segment
+    numbers: list[int] = field(default_factory=list)
+    appended: list[list[Segment]] = field(default_factory=list)
+
+    def segments(self, i: int) -> Iterator[Segment]:
+        yield self.intro
+        for step_segments in self.appended[: i + 1]:
+            yield from step_segments
+        yield Segment(CONTEXT_REQUEST.format(step=self.numbers[i]))
+
+    def prompt(self, i: int) -> str:
+        return "".join(segment.text for segment in self.segments(i))
+
+    def prompts(self) -> Iterator[tuple[int, str]]:
+        # (step number, context) in order, extending one buffer step by step.
+        parts = [self.intro.text]
+        for number, step_segments in zip(self.numbers, self.appended):
+            parts.extend(segment.text for segment in step_segments)
+            yield number, "".join(parts) + CONTEXT_REQUEST.format(step=number)
+
+    def token_volume(self, counter: TokenCounter) -> tuple[int, int]:
+        """(tokens over every step's context, tokens of distinct segments).
+
+        One pass: each context is the previous one plus the step's segments,
+        so the total is a running sum rather than a recount per step.
+        """
+        prefix = counter(self.intro)
+        total = 0
+        distinct: dict[str, int] = {self.intro.key: prefix}
+        for number, step_segments in zip(self.numbers, self.appended):
+            for segment in step_segments:
+                tokens = counter(segment)
+                prefix += tokens
+                distinct.setdefault(segment.key, tokens)
+            request = Segment(CONTEXT_REQUEST.format(step=number))
+            total += prefix + counter(request)
+        return total, sum(distinct.values())
+
+
+def build_contexts(trace_path: Path, policy: str = "changed-only") -> TraceContexts:
+    """Build every step's context of a trace in one forward pass.
+
+    Each step appends its heading and narration, then its files according
+    to `policy`: the whole workspace (full-state), only the files whose
+    content changed (changed-only), or unified diffs of the changed files
+    against their previous version, with new files in full (diffs).
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown context policy {policy!r}")
+    index = load_step_index(trace_path)
+    with trace_path.open("rb") as f:
+        preamble = f.read(index["steps"][0]["offset"] if index["steps"] else 0).decode("utf-8")
+    contexts = TraceContexts(trace_path.as_posix(), policy, Segment(CONTEXT_INTRO + preamble.strip() + "\n\n"))
+
+    state: dict[str, str] = {}
+    numbers = list(dict.fromkeys(entry["number"] for entry in index["steps"]))
+    for number in numbers:
+        step_text = read_step(trace_path, number, index=index)
+        step = step_text.step
+        narration = f"{step_text.narration}\n\n" if step_text.narration else ""
+        segments = [Segment(f"## Step {step.number}: {step.title}\n\n{narration}")]
+        changed = {path: content for path, content in step.snapshots.items() if state.get(path) != content}
+        if policy == "full-state":
+            for path in sorted(state.keys() | changed.keys()):
+                segments.append(_file_segment(path, changed.get(path, state.get(path))))
+        else:
+            for path in sorted(changed):
+                previous = state.get(path) if policy == "diffs" else None
+                segments.append(_file_segment(path, changed[path], diff_against=previous))
+        state.update(changed)
+        contexts.numbers.append(number)
+        contexts.appended.append(segments)
+    return contexts
+
+
+def raw_prefix_volume(trace_path: Path, counter: TokenCounter) -> int:
+    # What sending the trace markdown up to each step would cost.
+    index = load_step_index(trace_path)
+    data = trace_path.read_bytes()
+    ends: dict[int, int] = {}
+    for entry in index["steps"]:
+        ends[entry["number"]] = entry["end"]
+    return sum(
+        counter(Segment(CONTEXT_INTRO + data[:end].decode("utf-8") + CONTEXT_REQUEST.format(step=number)))
+        for number, end in ends.items()
+    )
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Report how many tokens feedback contexts for every step of every trace add up to under each "
+            "context policy, or print one step's context."
+        )
+    )
+    parser.add_argument("--traces-root", type=Path, default=Path("traces"))
+    parser.add_argument("--policy", choices=POLICIES, action="append", default=None, help="Repeatable (default: all)")
+    parser.add_argument("--trace", type=Path, default=None, help="Only this trace")
+    parser.add_argument("--step", type=int, default=None, help="With --trace, print this step's context")
+    parser.add_argument("--no-raw", action="store_true", help="Skip the raw-markdown baseline")
+    args = parser.parse_args(argv)
+    policies = args.policy or list(POLICIES)
+
+    if args.step is not None:
+        if args.trace is None:
+            raise SystemExit("error: --step requires --trace")
+        contexts = build_contexts(args.trace, policies[0])
+        if args.step not in contexts.numbers:
+            raise SystemExit(f"error: {args.trace} has no step {args.step}")
+        sys.stdout.write(contexts.prompt(contexts.numbers.index(args.step)))
+        return 0
+
+    try:
+        index = CorpusIndex.load_or_build(args.traces_root)
+    except CorpusIndexError as e:
+        raise SystemExit(f"error: {e}")
+    trace_paths = [Path(info.trace_path) for info in index.traces]
+    if args.trace is not None:
+        trace_paths = [args.trace]
+    counter = TokenCounter(args.traces_root / TOKEN_CACHE_NAME)
+    rows = []
+    if not args.no_raw:
+        rows.append(("raw markdown", sum(raw_prefix_volume(path, counter) for path in trace_paths), None))
+    for policy in policies:
+        total = distinct = 0
+        for path in trace_paths:
+            trace_total, trace_distinct = build_contexts(path, policy).token_volume(counter)
+            total += trace_total
+            distinct += trace_distinct
+        rows.append((policy, total, distinct))
+    counter.save()
+
+    contexts = sum(len(info.steps) for info in index.traces) if args.trace is None else None
+    print(f"{len(trace_paths)} traces" + (f", {contexts} step contexts" if contexts else ""))
+    print(f"{'policy':<14}{'tokens':>12}{'distinct':>12}")
+    for name, total, distinct in rows:
+        print(f"{name:<14}{total:>12,}{'' if distinct is None else f'{distinct:,}':>12}")
+    print(f"token cache: {counter.hits} hits, {counter.misses} counted")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from feedback_backend import Backend, BackendError, WorkItem
+from sqlite_lru import LruTable
+
+
+RESPONSE_CACHE_NAME = "feedback-cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_COLUMNS = ("model TEXT NOT NULL", "response TEXT NOT NULL", "prompt_bytes INTEGER NOT NULL", "created INTEGER NOT NULL")
+
+_TRAILING_SPACE_RE = re.compile(r"[ \t]+$", re.MULTILINE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    # Differences a model should not care about: line endings, trailing
+    # spaces, and blank lines at either end.
+    return _TRAILING_SPACE_RE.sub("", prompt.replace("\r\n", "\n").replace("\r", "\n")).strip("\n")
+
+
+def response_key(model: str, params: dict[str, object], prompt: str) -> str:
+    payload = json.dumps([model, params, normalize_prompt(prompt)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    stored: int = 0
+    evicted: int = 0
+    bytes_saved: int = 0
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0.0
+        return (
+            f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate, {self.expired} expired), "
+            f"{self.bytes_saved:,} bytes saved, {self.stored} stored, {self.evicted} evicted"
+        )
+
+
+class ResponseCache:
+    """Model responses in one SQLite file, keyed by response_key().
+
+    Entries older than `ttl` seconds count as misses. Once the stored
+    responses exceed `max_bytes`, the least recently used are evicted.
+    With `read_only`, the file is opened read-only and never changed, not
+    even to record use. Safe to share between threads and other processes.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float | None = None,
+        read_only: bool = False,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.read_only = read_only
+        self.stats = ResponseCacheStats()
+        self._lock = threading.Lock()
+        if read_only:
+            if not path.exists():
+                raise SystemExit(f"error: {path} does not exist")
+            self._db = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            self._table = LruTable(self._db, "responses", _COLUMNS, max_bytes=max_bytes)
+            return
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._table = LruTable(self._db, "responses", _COLUMNS, max_bytes=max_bytes)
+        self._table.create()
+        self.stats.evicted += self._table.evict()
+        self._db.commit()
+
+    def __enter__(self) -> ResponseCache:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        # The cached, unexpired responses among `keys`.
+        with self._lock:
+            placeholders = ",".join("?" * len(keys))
+            rows = self._db.execute(
+                f"SELECT key, response, prompt_bytes, created FROM responses WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            now = time.time_ns()
+            found, expired = {}, []
+            for key, response, prompt_bytes, created in rows:
+                if self.ttl is not None and now - created > self.ttl * 1e9:
+                    expired.append(key)
+                    continue
+                found[key] = response
+                self.stats.bytes_saved += prompt_bytes + len(response.encode("utf-8"))
+            self.stats.hits += len(found)
+            self.stats.misses += len(set(keys)) - len(found)
+            self.stats.expired += len(expired)
+            if not self.read_only:
+                self._table.touch(list(found), now)
+                self._table.delete(expired)
+                self._db.commit()
+            return found
+
+    def put_many(self, model: str, entries: list[tuple[str, str, str]]) -> None:
+        # entries: (key, prompt, response)
+        if self.read_only:
+            return
+        with self._lock:
+            now = time.time_ns()
+            for key, prompt, response in entries:
+                values = {"model": model, "response": response, "prompt_bytes": len(prompt.encode("utf-8")), "created": now}
+                self._table.put(key, values, size=len(response.encode("utf-8")) + len(key), now=now)
+                self.stats.stored += 1
+            self.stats.evicted += self._table.evict()
+            self._db.commit()
+
+
+class CachedBackend(Backend):
+    """Answers from a ResponseCache where it can, and from `backend` otherwise.
+
+    Only the items of a batch that miss are sent on, and identical prompts
+    in flight at the same time share one request. When the cache is read
+    only, a miss is an error instead, so a scoring run sees exactly the
+    recorded responses.
+    """
+
+    def __init__(self, backend: Backend, cache: ResponseCache) -> None:
+        super().__init__(backend.model, backend.params)
+        self.backend = backend
+        self.cache = cache
+        self._pending: dict[str, asyncio.Future] = {}
+
+    async def evaluate(self, batch: list[WorkItem]) -> list[str]:
+        keys = [response_key(self.model, self.params, item.prompt) for item in batch]
+        found = await asyncio.to_thread(self.cache.get_many, keys)
+        waiting = {key: self._pending[key] for key in keys if key not in found and key in self._pending}
+        misses: dict[str, WorkItem] = {}
+        for key, item in zip(keys, batch):
+            if key not in found and key not in waiting:
+                misses.setdefault(key, item)
+        if misses and self.cache.read_only:
+            raise BackendError(f"{next(iter(misses.values())).id}: not in the read-only cache", retryable=False)
+
+        if misses:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in misses}
+            self._pending.update(futures)
+            try:
+                responses = await self.backend.evaluate(list(misses.values()))
+            except BaseException as e:
+                for future in futures.values():
+                    # Waiters see the same error (and retry if it allows);
+                    # retrieve it so an unawaited future is not reported.
+                    future.set_exception(e)
+                    future.exception()
+                raise
+            finally:
+                for key in futures:
+                    self._pending.pop(key, None)
+            for (key, item), response in zip(misses.items(), responses):
+                futures[key].set_result(response)
+                found[key] = response
+            await asyncio.to_thread(
+                self.cache.put_many, self.model, [(key, item.prompt, found[key]) for key, item in misses.items()]
+            )
+        for key, future in waiting.items():
+            found[key] = await future
+        return [found[key] for key in keys]
+
+    async def close(self) -> None:
+        await self.backend.close()
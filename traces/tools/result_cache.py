@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Sequence
+
+from sqlite_lru import LruTable
+
+RESULT_CACHE_NAME = "snapshots-runs.sqlite"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_COLUMNS = ("exit_code INTEGER NOT NULL", "stdout TEXT NOT NULL", "stderr TEXT NOT NULL", "duration REAL NOT NULL")
+
+
+@dataclass(frozen=True)
+class CachedRun:
+    exit_code: int
+    stdout: str
+    stderr: str
+    duration: float
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stored: int = 0
+    evicted: int = 0
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), {self.stored} stored, {self.evicted} evicted"
+
+
+def tree_digest(file_hashes: Iterable[tuple[str, str]]) -> str:
+    # Identifies a working copy by the sha256 of every file in it.
+    h = hashlib.sha256()
+    for rel_path, digest in sorted(file_hashes):
+        h.update(f"{rel_path}\0{digest}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def run_keys(tree: str, runs: Sequence[tuple[str, Sequence[str], str, Sequence[tuple[str, str]]]]) -> list[str]:
+    """One key per (script, argv, stdin, extra files) run of a sequence.
+
+    Runs share a working copy, so a run's result can depend on what the
+    earlier ones wrote (todo.py add, then list). Each key therefore chains
+    the previous one, starting from the working copy and interpreter.
+    """
+    key = hashlib.sha256(f"{sys.version}\0{tree}".encode("utf-8")).hexdigest()
+    keys = []
+    for script, argv, stdin, files in runs:
+        payload = json.dumps([key, script, list(argv), stdin, sorted(map(list, files))], ensure_ascii=False)
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        keys.append(key)
+    return keys
+
+
+class ResultCache:
+    """Exit code, stdout and stderr of earlier runs, in one SQLite file.
+
+    Entries are evicted least recently used first once their total size
+    exceeds `max_bytes`. Safe to share between threads.
+    """
+
+    def __init__(self, path: Path, *, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._table = LruTable(self._db, "results", _COLUMNS, max_bytes=max_bytes)
+        self._table.create()
+        # The limit may have been lowered since the cache was filled.
+        self.stats.evicted += self._table.evict()
+        self._db.commit()
+
+    def __enter__(self) -> ResultCache:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def get_all(self, keys: Sequence[str]) -> list[CachedRun] | None:
+        # All of a sequence's runs, or None (a miss) unless every one is cached.
+        with self._lock:
+            placeholders = ",".join("?" * len(keys))
+            rows = {
+                key: CachedRun(exit_code, stdout, stderr, duration)
+                for key, exit_code, stdout, stderr, duration in self._db.execute(
+                    f"SELECT key, exit_code, stdout, stderr, duration FROM results WHERE key IN ({placeholders})",
+                    list(keys),
+                )
+            }
+            if len(rows) < len(set(keys)):
+                self.stats.misses += 1
+                return None
+            self._table.touch(keys, time.time_ns())
+            self._db.commit()
+            self.stats.hits += 1
+            return [rows[key] for key in keys]
+
+    def put_all(self, keys: Sequence[str], runs: Sequence[CachedRun]) -> None:
+        with self._lock:
+            now = time.time_ns()
+            for key, run in zip(keys, runs):
+                size = len(run.stdout.encode("utf-8")) + len(run.stderr.encode("utf-8")) + len(key)
+                values = {"exit_code": run.exit_code, "stdout": run.stdout, "stderr": run.stderr, "duration": run.duration}
+                self._table.put(key, values, size=size, now=now)
+                self.stats.stored += 1
+            self.stats.evicted += self._table.evict()
+            self._db.commit()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from blob_store import hash_bytes
+from extract_snapshots import iter_trace_files, load_manifest, trace_output_root
+from result_cache import DEFAULT_MAX_BYTES, RESULT_CACHE_NAME, CachedRun, ResultCache, run_keys, tree_digest
+
+
+HARNESS_NAME = "harness.py"
+RUN_REPORT_NAME = "snapshots-runs.jsonl"
+
+SAMPLE_TEXT = "the cat and the hat\nThe dog, the cat.\nA hat; a cat!\n"
+SAMPLE_MAZE = "#######\n#S...##\n##....#\n##...E#\n#######\n"
+
+
+@dataclass(frozen=True)
+class Command:
+    # Arguments after the script name, run from the step's working copy.
+    argv: tuple[str, ...]
+    stdin: str = ""
+    expect_ok: bool = True
+    # Extra input files written into the working copy before the run.
+    files: tuple[tuple[str, str], ...] = ()
+
+
+# The README acceptance commands of each problem, keyed by the CLI entry
+# script. A step's commands run in order in one working copy, so state (the
+# todo file) carries over from one command to the next.
+ENTRY_COMMANDS: dict[str, tuple[Command, ...]] = {
+    "convert.py": (
+        Command(("--to-f", "0")),
+        Command(("--to-c", "212")),
+        Command(("--to-f", "abc"), expect_ok=False),
+    ),
+    "count_words.py": (
+        Command(("sample.txt",), files=(("sample.txt", SAMPLE_TEXT),)),
+        Command(("--top", "3", "sample.txt"), files=(("sample.txt", SAMPLE_TEXT),)),
+        Command(("missing.txt",), expect_ok=False),
+    ),
+    "todo.py": (
+        Command(("add", "buy milk")),
+        Command(("list",)),
+        Command(("done", "1")),
+        Command(("done", "99"), expect_ok=False),
+    ),
+    "poster.py": (
+        Command(("hi",)),
+        Command(("--border", "none", "hi")),
+        Command(("--align", "center", "--width", "10", "one two three")),
+        Command(("--width", "1", "hi"), expect_ok=False),
+    ),
+    "play.py": (Command(("example-story.json",), stdin="1\n1\n1\n1\n1\n"),),
+    "life.py": (
+        Command(("--steps", "1", "patterns/blinker.txt")),
+        Command(("--steps", "0", "patterns/glider.txt")),
+        Command(("--steps", "1", "missing.txt"), expect_ok=False),
+    ),
+    "haiku.py": (Command(("--seed", "1", "--style", "haiku", "words/basic.txt")),),
+    "maze.py": (
+        Command(("gen", "--width", "7", "--height", "5", "--seed", "1")),
+        Command(("solve", "maze.txt"), files=(("maze.txt", SAMPLE_MAZE),)),
+    ),
+    "logo.py": (Command(("Hello",)),),
+}
+
+
+@dataclass(frozen=True)
+class Job:
+    trace_path: Path
+    step: int
+    step_dir: Path
+    # Files shared by a problem's traces (patterns/, words/, example-story.json);
+    # copied into the working copy under the snapshot files.
+    fixtures: tuple[Path, ...]
+    # harness.py if the step has one, otherwise its known CLI entries.
+    targets: tuple[str, ...]
+    # sha256 of every file in the working copy (fixtures overlaid by the step),
+    # from the manifest, so the working copy can be identified without reading it.
+    input_hashes: tuple[tuple[str, str], ...] = ()
+
+
+@dataclass
+class RunResult:
+    script: str
+    argv: list[str]
+    exit_code: int | None
+    stdout: str
+    stderr: str
+    duration: float
+    timed_out: bool = False
+    ok: bool = False
+    # "subprocess", "warm" for runs done by warm_executor.WarmExecutor, or
+    # "cache" for results replayed from result_cache.ResultCache.
+    executor: str = "subprocess"
+
+
+@dataclass
+class StepReport:
+    trace: str
+    step: int
+    # "pass", "fail" or "timeout"
+    status: str
+    exit_code: int | None
+    duration: float
+    runs: list[RunResult] = field(default_factory=list)
+
+
+def problem_fixtures(problem_dir: Path) -> tuple[Path, ...]:
+    fixtures = []
+    for entry in sorted(problem_dir.iterdir()):
+        if entry.name == "README.md":
+            continue
+        if entry.is_dir() and any(entry.glob("trace-*.md")):
+            continue
+        fixtures.append(entry)
+    return tuple(fixtures)
+
+
+def fixture_hashes(fixtures: tuple[Path, ...]) -> dict[str, str]:
+    hashes = {}
+    for fixture in fixtures:
+        files = sorted(p for p in fixture.rglob("*") if p.is_file()) if fixture.is_dir() else [fixture]
+        for path in files:
+            hashes[path.relative_to(fixture.parent).as_posix()] = hash_bytes(path.read_bytes())
+    return hashes
+
+
+def discover_jobs(traces_root: Path, *, trace: Path | None = None, harness: bool = True) -> list[Job]:
+    # With harness=False, steps run their CLI entries' commands even when
+    # they ship a harness.py.
+    jobs = []
+    fixtures_by_problem: dict[Path, tuple[Path, ...]] = {}
+    fixture_hashes_by_problem: dict[Path, dict[str, str]] = {}
+    for trace_path in sorted([trace] if trace is not None else iter_trace_files(traces_root)):
+        out_root = trace_output_root(trace_path, write_full_state=True)
+        manifest = load_manifest(out_root)
+        if manifest is None:
+            print(f"warning: no full-state output for {trace_path}; run extract_snapshots.py first", file=sys.stderr)
+            continue
+        problem_dir = trace_path.parent.parent
+        if problem_dir not in fixtures_by_problem:
+            fixtures_by_problem[problem_dir] = problem_fixtures(problem_dir)
+            fixture_hashes_by_problem[problem_dir] = fixture_hashes(fixtures_by_problem[problem_dir])
+        for step in manifest["steps"]:
+            files = set(step["all_files"])
+            if harness and HARNESS_NAME in files:
+                targets: tuple[str, ...] = (HARNESS_NAME,)
+            else:
+                targets = tuple(name for name in ENTRY_COMMANDS if name in files)
+            if targets:
+                jobs.append(
+                    Job(
+                        trace_path=trace_path,
+                        step=step["number"],
+                        step_dir=out_root / f"step-{step['number']:02d}",
+                        fixtures=fixtures_by_problem[problem_dir],
+                        targets=targets,
+                        input_hashes=tuple({**fixture_hashes_by_problem[problem_dir], **step["file_hashes"]}.items()),
+                    )
+                )
+    return jobs
+
+
+def prepare_workdir(job: Job, workdir: Path) -> None:
+    for fixture in job.fixtures:
+        if fixture.is_dir():
+            shutil.copytree(fixture, workdir / fixture.name, copy_function=shutil.copyfile, dirs_exist_ok=True)
+        else:
+            shutil.copyfile(fixture, workdir / fixture.name)
+    # Links into a --dedupe blob store are copied as regular files, so a
+    # script can never modify the store or the extracted output. copyfile
+    # rather than copy2: store blobs are read-only, and their mode must not
+    # carry over into a working copy that harnesses write to.
+    shutil.copytree(job.step_dir, workdir, copy_function=shutil.copyfile, dirs_exist_ok=True)
+
+
+def run_env() -> dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONHASHSEED"] = "0"
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def run_command(workdir: Path, script: str, command: Command, *, timeout: float) -> RunResult:
+    for rel_path, content in command.files:
+        (workdir / rel_path).write_text(content, encoding="utf-8")
+    argv = [script, *command.argv]
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [sys.executable, *argv],
+            cwd=workdir,
+            input=command.stdin,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            env=run_env(),
+        )
+    except subprocess.TimeoutExpired as e:
+        return RunResult(
+            script=script,
+            argv=list(command.argv),
+            exit_code=None,
+            stdout=_text(e.stdout),
+            stderr=_text(e.stderr),
+            duration=time.perf_counter() - start,
+            timed_out=True,
+        )
+    return RunResult(
+        script=script,
+        argv=list(command.argv),
+        exit_code=proc.returncode,
+        stdout=proc.stdout,
+        stderr=proc.stderr,
+        duration=time.perf_counter() - start,
+        ok=(proc.returncode == 0) == command.expect_ok,
+    )
+
+
+def _text(output: str | bytes | None) -> str:
+    if output is None:
+        return ""
+    return output.decode("utf-8", "replace") if isinstance(output, bytes) else output
+
+
+# run_command, or WarmExecutor.run_command.
+Runner = Callable[..., RunResult]
+
+
+def commands_for(target: str) -> tuple[Command, ...]:
+    return (Command(()),) if target == HARNESS_NAME else ENTRY_COMMANDS[target]
+
+
+def run_job(job: Job, *, timeout: float, runner: Runner = run_command, cache: ResultCache | None = None) -> StepReport:
+    plan = [(target, command) for target in job.targets for command in commands_for(target)]
+    cached = None
+    if cache is not None:
+        keys = run_keys(
+            tree_digest(job.input_hashes),
+            [(target, command.argv, command.stdin, command.files) for target, command in plan],
+        )
+        cached = cache.get_all(keys)
+
+    runs: list[RunResult] = []
+    if cached is not None:
+        for (target, command), hit in zip(plan, cached):
+            runs.append(
+                RunResult(
+                    script=target,
+                    argv=list(command.argv),
+                    exit_code=hit.exit_code,
+                    stdout=hit.stdout,
+                    stderr=hit.stderr,
+                    duration=hit.duration,
+                    ok=(hit.exit_code == 0) == command.expect_ok,
+                    executor="cache",
+                )
+            )
+    else:
+        with tempfile.TemporaryDirectory(prefix="snapshot-run-") as tmp:
+            workdir = Path(tmp)
+            prepare_workdir(job, workdir)
+            for target, command in plan:
+                runs.append(runner(workdir, target, command, timeout=timeout))
+        # Timeouts depend on the machine's load, not only on the inputs.
+        if cache is not None and not any(run.timed_out for run in runs):
+            cache.put_all(keys, [CachedRun(run.exit_code, run.stdout, run.stderr, run.duration) for run in runs])
+
+    if any(run.timed_out for run in runs):
+        status = "timeout"
+    elif all(run.ok for run in runs):
+        status = "pass"
+    else:
+        status = "fail"
+    # The exit code of the first run that did not behave as expected.
+    failing = next((run for run in runs if not run.ok), runs[-1])
+    return StepReport(
+        trace=job.trace_path.as_posix(),
+        step=job.step,
+        status=status,
+        exit_code=failing.exit_code,
+        duration=round(sum(run.duration for run in runs), 6),
+        runs=runs,
+    )
+
+
+def report_line(report: StepReport, *, with_output: bool = False) -> str:
+    row = asdict(report)
+    for run in row["runs"]:
+        run["duration"] = round(run["duration"], 6)
+        if not with_output:
+            del run["stdout"], run["stderr"]
+    return json.dumps(row, ensure_ascii=False)
+
+
+def run_all(
+    jobs: list[Job],
+    *,
+    workers: int,
+    timeout: float,
+    runner: Runner = run_command,
+    cache: ResultCache | None = None,
+) -> list[StepReport]:
+    # Runs happen in other processes, so threads are enough to keep `workers`
+    # of them busy. Reports come back in job order, whichever finishes first.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda job: run_job(job, timeout=timeout, runner=runner, cache=cache), jobs))
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run every full-state step that ships a harness.py or a known CLI entry "
+            f"({', '.join(ENTRY_COMMANDS)}) in an isolated working copy, and write one "
+            "JSON line per (trace, step)."
+        )
+    )
+    parser.add_argument("--traces-root", type=Path, default=Path("traces"))
+    parser.add_argument("--trace", type=Path, default=None, help="Run only one trace file")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Steps to run at once (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds allowed per script run (default: 10)")
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        help=f"JSON-lines report path (default: <traces-root>/{RUN_REPORT_NAME})",
+    )
+    parser.add_argument("--with-output", action="store_true", help="Include stdout and stderr in the report")
+    parser.add_argument(
+        "--fail-on-fail",
+        action="store_true",
+        help="Exit non-zero when a step fails, not only when one times out (many steps fail by design)",
+    )
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help=(
+            "Run scripts in forks of a pre-warmed interpreter instead of starting Python for every "
+            "run (see warm_executor.py); falls back to a subprocess where results could differ"
+        ),
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=None,
+        help=(
+            "SQLite file caching results by working-copy content, argv, stdin and Python version "
+            f"(default: <traces-root>/{RESULT_CACHE_NAME})"
+        ),
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Run everything and leave the cache untouched")
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=DEFAULT_MAX_BYTES / (1024 * 1024),
+        help="Evict least recently used results beyond this size (default: %(default)g)",
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        raise SystemExit("error: --jobs must be at least 1")
+
+    jobs = discover_jobs(args.traces_root, trace=args.trace)
+    if not jobs:
+        raise SystemExit(f"No runnable snapshots found under {args.traces_root}")
+    with ExitStack() as stack:
+        cache = None
+        if not args.no_cache:
+            cache_path = args.cache if args.cache is not None else args.traces_root / RESULT_CACHE_NAME
+            cache = stack.enter_context(ResultCache(cache_path, max_bytes=int(args.cache_max_mb * 1024 * 1024)))
+        runner: Runner = run_command
+        executor = None
+        if args.warm:
+            from warm_executor import WarmExecutor
+
+            executor = stack.enter_context(WarmExecutor(args.jobs))
+            runner = executor.run_command
+        reports = run_all(jobs, workers=args.jobs, timeout=args.timeout, runner=runner, cache=cache)
+    if executor is not None:
+        print(f"warm executor: {executor.fallbacks} runs fell back to a subprocess")
+    if cache is not None:
+        print(f"result cache (per step): {cache.stats}")
+
+    report_path = args.report if args.report is not None else args.traces_root / RUN_REPORT_NAME
+    with report_path.open("w", encoding="utf-8") as f:
+        for report in reports:
+            f.write(report_line(report, with_output=args.with_output) + "\n")
+
+    counts = {status: sum(1 for r in reports if r.status == status) for status in ("pass", "fail", "timeout")}
+    for report in reports:
+        if report.status != "pass":
+            print(f"{report.status:<8}{report.trace} step {report.step:02d} (exit {report.exit_code})")
+    print(
+        f"{len(reports)} steps run: {counts['pass']} passed, {counts['fail']} failed, "
+        f"{counts['timeout']} timed out; report: {report_path}"
+    )
+    failing = ("fail", "timeout") if args.fail_on_fail else ("timeout",)
+    return 1 if any(counts[status] for status in failing) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
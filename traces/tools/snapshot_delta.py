@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import bisect
+import difflib
+import functools
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import List
+
+
+DELTA_DIRNAME = "delta"
+
+# A delta is a list of [start, end, new_lines] edits in old-line coordinates,
+# ordered by `start`: old_lines[start:end] is replaced by new_lines.
+Delta = List[list]
+
+
+def delta_output_root(trace_path: Path) -> Path:
+    return trace_path.parent / "snapshots" / trace_path.stem / DELTA_DIRNAME
+
+
+def deltas_file(out_root: Path, step_number: int) -> Path:
+    return out_root / "deltas" / f"step-{step_number:02d}.json"
+
+
+def split_lines(content: str) -> list[str]:
+    return content.splitlines(keepends=True)
+
+
+def encode_delta(old_lines: list[str], new_lines: list[str]) -> Delta:
+    matcher = difflib.SequenceMatcher(a=old_lines, b=new_lines, autojunk=False)
+    return [
+        [i1, i2, new_lines[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_delta(old_lines: list[str], delta: Delta) -> list[str]:
+    out: list[str] = []
+    pos = 0
+    for start, end, replacement in delta:
+        out.extend(old_lines[pos:start])
+        out.extend(replacement)
+        pos = end
+    out.extend(old_lines[pos:])
+    return out
+
+
+class DeltaTrace:
+    """Rebuilds any file at any step from a trace's `delta/` output.
+
+    Reconstructed versions are kept in an LRU cache keyed by (path, version
+    step), so walking the steps of a trace in order costs one delta
+    application per changed file per step.
+    """
+
+    def __init__(self, out_root: Path, *, cache_size: int = 128) -> None:
+        self.out_root = out_root
+        self.manifest = json.loads((out_root / "manifest.json").read_text(encoding="utf-8"))
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple[str, int], list[str]] = OrderedDict()
+        self._load_deltas = functools.lru_cache(maxsize=8)(self._read_deltas)
+
+        # path -> sorted step numbers at which the path changed, and how each
+        # of those versions was stored ("full" or "delta").
+        self._versions: dict[str, list[int]] = {}
+        self._encodings: dict[tuple[str, int], str] = {}
+        for step in self.manifest["steps"]:
+            for rel_path, encoding in step["encodings"].items():
+                versions = self._versions.setdefault(rel_path, [])
+                if not versions or versions[-1] != step["number"]:
+                    versions.append(step["number"])
+                self._encodings[(rel_path, step["number"])] = encoding
+
+    @property
+    def steps(self) -> list[int]:
+        return [step["number"] for step in self.manifest["steps"]]
+
+    def files_at(self, step: int) -> list[str]:
+        for entry in reversed(self.manifest["steps"]):
+            if entry["number"] <= step:
+                return entry["all_files"]
+        return []
+
+    def materialize(self, step: int, rel_path: str) -> str:
+        versions = self._versions.get(rel_path, [])
+        idx = bisect.bisect_right(versions, step)
+        if idx == 0:
+            raise KeyError(f"{rel_path} does not exist at step {step} of {self.manifest['trace']}")
+        return "".join(self._version_lines(rel_path, idx - 1))
+
+    def _read_deltas(self, step_number: int) -> dict[str, Delta]:
+        return json.loads(deltas_file(self.out_root, step_number).read_text(encoding="utf-8"))
+
+    def _version_lines(self, rel_path: str, version_idx: int) -> list[str]:
+        versions = self._versions[rel_path]
+
+        # Walk back to the nearest version that is cached or stored in full,
+        # then replay deltas forward, caching every version on the way.
+        start = version_idx
+        while (rel_path, versions[start]) not in self._cache and self._encodings[(rel_path, versions[start])] != "full":
+            start -= 1
+
+        key = (rel_path, versions[start])
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            lines = self._cache[key]
+        else:
+            full_path = self.out_root / f"step-{versions[start]:02d}" / rel_path
+            lines = split_lines(full_path.read_text(encoding="utf-8"))
+            self._remember(key, lines)
+
+        for idx in range(start + 1, version_idx + 1):
+            lines = apply_delta(lines, self._load_deltas(versions[idx])[rel_path])
+            self._remember((rel_path, versions[idx]), lines)
+        return lines
+
+    def _remember(self, key: tuple[str, int], lines: list[str]) -> None:
+        self._cache[key] = lines
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+@functools.lru_cache(maxsize=16)
+def open_delta_trace(out_root: Path) -> DeltaTrace:
+    return DeltaTrace(out_root)
+
+
+def materialize(trace_path: Path, step: int, rel_path: str) -> str:
+    """Return the contents of `rel_path` as of `step` in the delta output of `trace_path`."""
+    return open_delta_trace(delta_output_root(trace_path)).materialize(step, rel_path)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Print a file at a given step from a trace's delta snapshots.")
+    parser.add_argument("trace", type=Path, help="Trace file, e.g. traces/conway-life-sim/optimizer/trace-01.md")
+    parser.add_argument("step", type=int)
+    parser.add_argument("path", help="Snapshot path, e.g. life.py")
+    args = parser.parse_args(argv)
+
+    try:
+        print(materialize(args.trace, args.step, args.path), end="")
+    except FileNotFoundError as e:
+        raise SystemExit(f"error: {e}")
+    except KeyError as e:
+        raise SystemExit(f"error: {e.args[0]}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(os.sys.argv[1:]))
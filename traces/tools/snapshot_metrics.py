@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import ast
+import csv
+import os
+import sys
+from pathlib import Path
+
+from ast_diff import FingerprintCache
+from corpus_index import CorpusIndex, CorpusIndexError, Snapshot
+
+
+METRICS_CACHE_NAME = "snapshots-metrics-cache.json"
+METRICS_NAME = "snapshots-metrics.csv"
+TREND_NAME = "snapshots-metrics-trend.csv"
+METRICS_VERSION = f"2-py{sys.version_info[0]}.{sys.version_info[1]}"
+
+METRIC_FIELDS = ("loc", "functions", "complexity", "max_complexity", "max_nesting", "validations", "parse_error")
+
+# match statements need Python 3.10 and except* 3.11; older interpreters
+# cannot parse them anyway, so the node types are only used where they exist.
+_MATCH_CASE = getattr(ast, "match_case", None)
+_MATCH = getattr(ast, "Match", None)
+_TRY_STAR = getattr(ast, "TryStar", None)
+
+_BRANCHES = tuple(
+    node_type
+    for node_type in (ast.If, ast.IfExp, ast.For, ast.AsyncFor, ast.While, ast.ExceptHandler, ast.Assert, _MATCH_CASE)
+    if node_type is not None
+)
+_BLOCKS = tuple(
+    node_type
+    for node_type in (ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith, ast.Try, _TRY_STAR, _MATCH)
+    if node_type is not None
+)
+_SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+
+
+def _decisions(node: ast.AST) -> int:
+    # Decision points of one scope, not counting nested functions and classes.
+    count = 0
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, _SCOPES):
+            continue
+        if isinstance(child, _BRANCHES):
+            count += 1
+        elif isinstance(child, ast.BoolOp):
+            count += len(child.values) - 1
+        elif isinstance(child, ast.comprehension):
+            count += 1 + len(child.ifs)
+        count += _decisions(child)
+    return count
+
+
+def _nesting(node: ast.AST, depth: int = 0) -> int:
+    deepest = depth
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, _BLOCKS):
+            # An elif is written at the same depth as its if.
+            is_elif = isinstance(node, ast.If) and isinstance(child, ast.If) and node.orelse == [child]
+            deepest = max(deepest, _nesting(child, depth if is_elif else depth + 1))
+        else:
+            deepest = max(deepest, _nesting(child, depth))
+    return deepest
+
+
+def _parser_names(tree: ast.AST) -> set[str]:
+    # Names bound to argparse parsers: assigned from ArgumentParser(...) or
+    # subparsers.add_parser(...), plus the conventional `parser` and `ap`.
+    names = {"parser", "ap"}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets, value = [node.target], node.value
+        else:
+            continue
+        if not isinstance(value, ast.Call):
+            continue
+        func = value.func
+        called = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+        if called in ("ArgumentParser", "add_parser"):
+            names.update(target.id for target in targets if isinstance(target, ast.Name))
+    return names
+
+
+def _is_validation(node: ast.AST, parsers: set[str]) -> bool:
+    # raise SystemExit("error: ..."), sys.exit("...") and parser.error("..."):
+    # exits that report bad input with a message rather than a status code.
+    # `parsers` are the names .error() counts on (see _parser_names).
+    if isinstance(node, ast.Raise) and isinstance(node.exc, ast.Call):
+        call = node.exc
+        if not (isinstance(call.func, ast.Name) and call.func.id == "SystemExit"):
+            return False
+    elif isinstance(node, ast.Call):
+        call = node
+        func = call.func
+        if not (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)):
+            return False
+        receiver = func.value.id
+        if not (func.attr == "exit" and receiver == "sys" or func.attr == "error" and receiver in parsers):
+            return False
+    else:
+        return False
+    if not call.args:
+        return False
+    message = call.args[0]
+    return isinstance(message, ast.JoinedStr) or (isinstance(message, ast.Constant) and isinstance(message.value, str))
+
+
+def file_metrics(source: str) -> dict:
+    """Size and complexity metrics of one Python file.
+
+    `complexity` is the cyclomatic complexity of the module body plus that of
+    every function (1 + its decision points); `max_complexity` is the largest
+    single one. `max_nesting` counts nested control-flow blocks.
+    """
+    loc = sum(1 for line in source.splitlines() if line.strip() and not line.lstrip().startswith("#"))
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return {**dict.fromkeys(METRIC_FIELDS, 0), "loc": loc, "parse_error": 1}
+    functions = [node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    parsers = _parser_names(tree)
+    scores = [1 + _decisions(tree)] + [1 + _decisions(node) for node in functions]
+    return {
+        "loc": loc,
+        "functions": len(functions),
+        "complexity": sum(scores),
+        "max_complexity": max(scores),
+        "max_nesting": _nesting(tree),
+        "validations": sum(1 for node in ast.walk(tree) if _is_validation(node, parsers)),
+        "parse_error": 0,
+    }
+
+
+def step_totals(snapshots: list[Snapshot], metrics: dict[str, dict]) -> dict[tuple[str, str, str, int], dict]:
+    # Metrics of every Python file of a step, added up (maxima for the max_
+    # columns), keyed by (problem, persona, trace, step).
+    totals: dict[tuple[str, str, str, int], dict] = {}
+    for snapshot in snapshots:
+        key = (snapshot.problem, snapshot.persona, snapshot.trace, snapshot.step)
+        total = totals.setdefault(key, dict.fromkeys(METRIC_FIELDS, 0))
+        for field, value in metrics[snapshot.sha256].items():
+            total[field] = max(total[field], value) if field.startswith("max_") else total[field] + value
+    return totals
+
+
+def persona_trend(totals: dict[tuple[str, str, str, int], dict]) -> list[dict]:
+    # Per persona and step number, the mean of the step totals over every
+    # trace (of any problem) that has that step.
+    groups: dict[tuple[str, int], list[dict]] = {}
+    for (_, persona, _, step), total in totals.items():
+        groups.setdefault((persona, step), []).append(total)
+    rows = []
+    for (persona, step), group in sorted(groups.items()):
+        row = {"persona": persona, "step": step, "traces": len(group)}
+        for field in METRIC_FIELDS:
+            row[field] = round(sum(total[field] for total in group) / len(group), 2)
+        rows.append(row)
+    return rows
+
+
+def write_csv(path: Path, fieldnames: list[str], rows: list[dict]) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            f"Compute code metrics for every Python snapshot file and write them to <traces-root>/{METRICS_NAME} "
+            f"(one row per file per step) and <traces-root>/{TREND_NAME} (per persona and step). "
+            f"Each distinct file is measured once; results are cached in <traces-root>/{METRICS_CACHE_NAME}."
+        )
+    )
+    parser.add_argument("--traces-root", type=Path, default=Path("traces"))
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Processes to measure new files with")
+    parser.add_argument("--output", type=Path, default=None, help=f"Per-file CSV (default: <traces-root>/{METRICS_NAME})")
+    parser.add_argument("--trend", type=Path, default=None, help=f"Per-persona CSV (default: <traces-root>/{TREND_NAME})")
+    args = parser.parse_args(argv)
+
+    try:
+        index = CorpusIndex.load_or_build(args.traces_root)
+        sources = index.blob_locations(suffix=".py")
+    except CorpusIndexError as e:
+        raise SystemExit(f"error: {e}")
+    snapshots = [snapshot for snapshot in index.query() if snapshot.path.endswith(".py")]
+    cache = FingerprintCache(args.traces_root / METRICS_CACHE_NAME, compute=file_metrics, version=METRICS_VERSION)
+    measured = cache.fill(sources, jobs=args.jobs)
+    cache.save()
+    metrics = cache.fingerprints
+
+    output = args.output if args.output is not None else args.traces_root / METRICS_NAME
+    write_csv(
+        output,
+        ["problem", "persona", "trace", "step", "path", "sha256", "changed", *METRIC_FIELDS],
+        [
+            {
+                "problem": s.problem,
+                "persona": s.persona,
+                "trace": s.trace,
+                "step": s.step,
+                "path": s.path,
+                "sha256": s.sha256,
+                "changed": int(s.changed),
+                **metrics[s.sha256],
+            }
+            for s in snapshots
+        ],
+    )
+    trend = persona_trend(step_totals(snapshots, metrics))
+    trend_path = args.trend if args.trend is not None else args.traces_root / TREND_NAME
+    write_csv(trend_path, ["persona", "step", "traces", *METRIC_FIELDS], trend)
+    print(f"{len(snapshots)} file snapshots, {len(sources)} distinct ({measured} measured); wrote {output} and {trend_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
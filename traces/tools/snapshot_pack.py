@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+
+
+# Layout of a pack file:
+#   PACK_MAGIC                     8 bytes
+#   header length                  little-endian u64
+#   header                         UTF-8 JSON: trace metadata, steps and an index of
+#                                  [step, path, offset, length, sha256] entries
+#   data                           concatenated blobs; offsets are relative to here
+# Every (step, path) of the full workspace is indexed, but each distinct blob is
+# stored once.
+PACK_MAGIC = b"BRPACK1\n"
+_LENGTH = struct.Struct("<Q")
+
+
+def pack_path_for(trace_path: Path) -> Path:
+    return trace_path.parent / "snapshots" / f"{trace_path.stem}.pack"
+
+
+class PackWriter:
+    def __init__(self, target: Path) -> None:
+        self.target = target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Blob data is spooled to a temporary file because the header (which
+        # holds the offsets) has to be written in front of it.
+        self._data = tempfile.TemporaryFile(dir=target.parent)
+        self._offsets: dict[str, tuple[int, int]] = {}
+        self._size = 0
+        self.entries: list[list] = []
+
+    def add(self, step_number: int, rel_path: str, data: bytes, digest: str) -> None:
+        if digest not in self._offsets:
+            self._data.write(data)
+            self._offsets[digest] = (self._size, len(data))
+            self._size += len(data)
+        offset, length = self._offsets[digest]
+        self.entries.append([step_number, rel_path, offset, length, digest])
+
+    def finish(self, header: dict) -> None:
+        header = {**header, "entries": self.entries}
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        fd, tmp_name = tempfile.mkstemp(dir=self.target.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(PACK_MAGIC)
+                out.write(_LENGTH.pack(len(header_bytes)))
+                out.write(header_bytes)
+                self._data.seek(0)
+                shutil.copyfileobj(self._data, out)
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, self.target)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        finally:
+            self._data.close()
+
+
+def read_pack_header(pack_path: Path) -> dict:
+    with pack_path.open("rb") as f:
+        if f.read(len(PACK_MAGIC)) != PACK_MAGIC:
+            raise ValueError(f"{pack_path}: not a snapshot pack")
+        (header_len,) = _LENGTH.unpack(f.read(_LENGTH.size))
+        return json.loads(f.read(header_len).decode("utf-8"))
+
+
+class PackReader:
+    """Random access to the snapshots in a pack file through a read-only mmap.
+
+    `view()` returns zero-copy memoryviews into the mapping; release them
+    before calling `close()`.
+    """
+
+    def __init__(self, pack_path: Path) -> None:
+        self.path = pack_path
+        with pack_path.open("rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[: len(PACK_MAGIC)] != PACK_MAGIC:
+            self._mm.close()
+            raise ValueError(f"{pack_path}: not a snapshot pack")
+        (header_len,) = _LENGTH.unpack_from(self._mm, len(PACK_MAGIC))
+        header_start = len(PACK_MAGIC) + _LENGTH.size
+        self.header = json.loads(self._mm[header_start : header_start + header_len].decode("utf-8"))
+        self._data_start = header_start + header_len
+        self._index: dict[tuple[int, str], tuple[int, int, str]] = {
+            (step, rel_path): (offset, length, digest)
+            for step, rel_path, offset, length, digest in self.header["entries"]
+        }
+
+    def __enter__(self) -> PackReader:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._mm.close()
+
+    @property
+    def steps(self) -> list[dict]:
+        return self.header["steps"]
+
+    def files(self, step: int) -> list[str]:
+        return sorted(rel_path for (number, rel_path) in self._index if number == step)
+
+    def digest(self, step: int, rel_path: str) -> str:
+        return self._lookup(step, rel_path)[2]
+
+    def view(self, step: int, rel_path: str) -> memoryview:
+        offset, length, _ = self._lookup(step, rel_path)
+        start = self._data_start + offset
+        return memoryview(self._mm)[start : start + length]
+
+    def read_text(self, step: int, rel_path: str) -> str:
+        with self.view(step, rel_path) as view:
+            return str(view, "utf-8")
+
+    def _lookup(self, step: int, rel_path: str) -> tuple[int, int, str]:
+        try:
+            return self._index[(step, rel_path)]
+        except KeyError:
+            raise KeyError(f"{rel_path} does not exist at step {step} of {self.header['trace']}") from None
+
+
+def export_pack(pack_path: Path, *, write_full_state: bool, strategy: str = "clean") -> dict:
+    # Rebuild the regular snapshots/<trace>/<mode>/ directory layout (and its
+    # manifest) from a pack, exactly as extract_snapshots.py would write it.
+    from extract_snapshots import Step, write_snapshots
+
+    with PackReader(pack_path) as reader:
+        steps = (
+            Step(
+                number=entry["number"],
+                title=entry["title"],
+                snapshots={rel_path: reader.read_text(entry["number"], rel_path) for rel_path in entry["changed_files"]},
+            )
+            for entry in reader.steps
+        )
+        return write_snapshots(
+            Path(reader.header["trace"]),
+            steps,
+            write_full_state=write_full_state,
+            strategy=strategy,
+            source_sha256=reader.header["source_sha256"],
+        )
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Read snapshot packs written by extract_snapshots.py --pack.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    show = sub.add_parser("show", help="Print one file at one step")
+    show.add_argument("pack", type=Path)
+    show.add_argument("step", type=int)
+    show.add_argument("path")
+
+    ls = sub.add_parser("ls", help="List the steps and files in a pack")
+    ls.add_argument("pack", type=Path)
+
+    export = sub.add_parser("export", help="Write the regular snapshot directory layout from a pack")
+    export.add_argument("pack", type=Path, nargs="+")
+    export.add_argument("--changed-only", action="store_true", help="Only write files changed in each step")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        with PackReader(args.pack) as reader:
+            try:
+                print(reader.read_text(args.step, args.path), end="")
+            except KeyError as e:
+                raise SystemExit(f"error: {e.args[0]}")
+    elif args.command == "ls":
+        with PackReader(args.pack) as reader:
+            for entry in reader.steps:
+                print(f"step {entry['number']:02d}: {', '.join(reader.files(entry['number']))}")
+    else:
+        for pack_path in args.pack:
+            export_pack(pack_path, write_full_state=not args.changed_only)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(os.sys.argv[1:]))
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import Iterable, Mapping, Sequence
+
+
+class LruTable:
+    """One SQLite table of sized entries, evicted least recently used first.
+
+    Every row has a `key` (the primary key), the caller's `columns` (SQL
+    column definitions), its `size` in bytes and a `last_used` timestamp.
+    The total size is kept up to date as rows are put and deleted, and
+    `evict` drops the least recently used rows until it is at most
+    `max_bytes`. Not locked and never commits: callers serialize access and
+    commit when they are done.
+    """
+
+    def __init__(self, db: sqlite3.Connection, table: str, columns: Sequence[str], *, max_bytes: int) -> None:
+        self.db = db
+        self.table = table
+        self.columns = columns
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def create(self) -> None:
+        # Creates the table if needed and loads the total size of its rows.
+        self.db.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                {", ".join(self.columns)},
+                size INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS {self.table}_last_used ON {self.table} (last_used);
+            """
+        )
+        (self.size,) = self.db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+
+    def put(self, key: str, values: Mapping[str, object], *, size: int, now: int) -> None:
+        # By column name, so files created with an older column order still work.
+        old = self.db.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        row = {"key": key, **values, "size": size, "last_used": now}
+        self.db.execute(
+            f"INSERT OR REPLACE INTO {self.table} ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+            list(row.values()),
+        )
+        self.size += size - (old[0] if old else 0)
+
+    def touch(self, keys: Sequence[str], now: int) -> None:
+        if keys:
+            self.db.execute(
+                f"UPDATE {self.table} SET last_used = ? WHERE key IN ({','.join('?' * len(keys))})", [now, *keys]
+            )
+
+    def delete(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            row = self.db.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.size -= row[0]
+
+    def evict(self) -> int:
+        # Returns how many rows were dropped.
+        evicted = 0
+        while self.size > self.max_bytes:
+            rows = self.db.execute(f"SELECT key, size FROM {self.table} ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.size <= self.max_bytes:
+                    break
+                self.db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.size -= size
+                evicted += 1
+        return evicted
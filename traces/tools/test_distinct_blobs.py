@@ -0,0 +1,88 @@
+"""Regression tests for tools that fingerprint each distinct snapshot body once.
+
+Run with `python -m unittest discover traces/tools`.
+"""
+from __future__ import annotations
+
+import contextlib
+import csv
+import io
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import ast_diff  # noqa: E402
+import extract_snapshots  # noqa: E402
+import snapshot_metrics  # noqa: E402
+from corpus_index import CorpusIndex  # noqa: E402
+
+# a.txt and b.py have the same body, so they share one sha256; a.txt sorts
+# first and used to be picked as the blob's representative.
+COLLIDING_TRACE = """# Trace 01
+
+## Step 1: Same body, two files
+
+Snapshot: a.txt
+```text
+x = 1
+```
+
+Snapshot: b.py
+```python
+x = 1
+```
+
+## Step 2: Change the Python file
+
+Snapshot: b.py
+```python
+x = 2
+```
+"""
+
+
+class DistinctBlobsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        trace = self.root / "problem" / "persona" / "trace-01.md"
+        trace.parent.mkdir(parents=True)
+        trace.write_text(COLLIDING_TRACE, encoding="utf-8")
+        self.run_tool(extract_snapshots, "--changed-only")
+        self.trace = trace
+
+    def run_tool(self, module, *args: str) -> str:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(module.main(["--traces-root", str(self.root), *args]), 0)
+        return out.getvalue()
+
+    def test_suffix_filters_before_deduplicating(self) -> None:
+        index = CorpusIndex.load_or_build(self.root)
+        self.assertEqual(len(index.distinct_blobs()), 2)
+        python_blobs = index.distinct_blobs(suffix=".py")
+        self.assertEqual(len(python_blobs), 2)
+        self.assertTrue(all(snapshot.path == "b.py" for snapshot in python_blobs.values()))
+        for location in index.blob_locations(suffix=".py").values():
+            self.assertEqual(location.name, "b.py")
+
+    def test_ast_diff_with_colliding_text_file(self) -> None:
+        self.run_tool(ast_diff, "--jobs", "1")
+        sidecar = self.trace.parent / "snapshots" / self.trace.stem / ast_diff.AST_DIFF_NAME
+        steps = json.loads(sidecar.read_text(encoding="utf-8"))["steps"]
+        self.assertEqual([list(step["files"]) for step in steps], [["b.py"], ["b.py"]])
+
+    def test_snapshot_metrics_with_colliding_text_file(self) -> None:
+        self.run_tool(snapshot_metrics, "--jobs", "1")
+        with (self.root / snapshot_metrics.METRICS_NAME).open(encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([(row["step"], row["path"], row["loc"]) for row in rows], [("1", "b.py", "1"), ("2", "b.py", "1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
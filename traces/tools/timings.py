@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, TypeVar
+
+
+T = TypeVar("T")
+
+
+class Timings:
+    """Wall and CPU time per named phase, plus integer counters.
+
+    Phases nest, and time is charged exclusively: while a nested phase runs,
+    its parent is paused, so the phase totals add up to the measured time.
+    A disabled instance makes every call a no-op.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.wall: dict[str, float] = {}
+        self.cpu: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self._stack: list[list] = []
+
+    def _charge(self, wall_now: float, cpu_now: float) -> None:
+        frame = self._stack[-1]
+        name = frame[0]
+        self.wall[name] = self.wall.get(name, 0.0) + wall_now - frame[1]
+        self.cpu[name] = self.cpu.get(name, 0.0) + cpu_now - frame[2]
+        frame[1], frame[2] = wall_now, cpu_now
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        wall_now, cpu_now = time.perf_counter(), time.process_time()
+        if self._stack:
+            self._charge(wall_now, cpu_now)
+        self._stack.append([name, wall_now, cpu_now])
+        try:
+            yield
+        finally:
+            wall_now, cpu_now = time.perf_counter(), time.process_time()
+            self._charge(wall_now, cpu_now)
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][1], self._stack[-1][2] = wall_now, cpu_now
+
+    def timed_iter(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        # Charges the time spent producing each item (e.g. a streaming parser)
+        # to `name`, and the time the consumer spends on it to the consumer.
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add(self, other: Timings) -> None:
+        for name, seconds in other.wall.items():
+            self.wall[name] = self.wall.get(name, 0.0) + seconds
+        for name, seconds in other.cpu.items():
+            self.cpu[name] = self.cpu.get(name, 0.0) + seconds
+        for name, amount in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @property
+    def total_wall(self) -> float:
+        return sum(self.wall.values())
+
+    @property
+    def total_cpu(self) -> float:
+        return sum(self.cpu.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "wall_seconds": round(self.total_wall, 6),
+            "cpu_seconds": round(self.total_cpu, 6),
+            "phases": {
+                name: {"wall_seconds": round(self.wall[name], 6), "cpu_seconds": round(self.cpu.get(name, 0.0), 6)}
+                for name in sorted(self.wall)
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+
+NO_TIMINGS = Timings(enabled=False)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+from extract_snapshots import (
+    FENCE_END_RE,
+    FENCE_START_RE,
+    SNAPSHOT_LINE_RE,
+    STEP_HEADING_RE,
+    Step,
+    iter_document_steps,
+    safe_rel_path,
+    stat_key,
+)
+
+
+# Sidecar next to the extracted output: snapshots/<trace-stem>/step-index.json.
+# It records, for the trace file it was built from (identified by size and
+# mtime), the byte range of every step and of every Snapshot block in it.
+STEP_INDEX_NAME = "step-index.json"
+STEP_INDEX_VERSION = 2
+
+
+@dataclass
+class StepText:
+    step: Step
+    # The step's prose: everything between its heading and the next one,
+    # minus the Snapshot blocks.
+    narration: str
+
+
+def step_index_path(trace_path: Path) -> Path:
+    return trace_path.parent / "snapshots" / trace_path.stem / STEP_INDEX_NAME
+
+
+def _iter_line_offsets(trace_path: Path) -> Iterator[tuple[int, str]]:
+    # (byte offset, line) with the same line boundaries as iter_trace_lines.
+    offset = 0
+    with trace_path.open("rb") as f:
+        for raw in f:
+            for line in raw.decode("utf-8").splitlines(keepends=True):
+                yield offset, line.splitlines()[0]
+                offset += len(line.encode("utf-8"))
+
+
+def build_step_index(trace_path: Path) -> dict:
+    # One pass over the file that mirrors iter_document_steps' structure
+    # (headings, Snapshot lines, the fence after them, the closing fence)
+    # without keeping any content. Raises the parser's ValueError for the
+    # first malformed Snapshot block, since the parser rejects the whole trace.
+    mtime_ns, size = stat_key(trace_path)
+    steps: list[dict] = []
+    lines = _iter_line_offsets(trace_path)
+    for offset, line in lines:
+        heading_match = STEP_HEADING_RE.match(line)
+        if heading_match:
+            if steps:
+                steps[-1]["end"] = offset
+            steps.append({"number": int(heading_match.group(2)), "offset": offset, "end": size, "snapshots": []})
+            continue
+        snapshot_match = SNAPSHOT_LINE_RE.match(line)
+        if snapshot_match:
+            if not steps:
+                raise ValueError(f"{trace_path}: Snapshot before any Step heading")
+            rel_path = safe_rel_path(snapshot_match.group(1))
+            fence_line = next((inner for _, inner in lines if inner.strip() != ""), None)
+            if fence_line is None or not FENCE_START_RE.match(fence_line):
+                raise ValueError(f"{trace_path}: Snapshot for {rel_path} missing fenced code block")
+            # The block ends after its closing fence.
+            for inner_offset, inner in lines:
+                if FENCE_END_RE.match(inner):
+                    end = inner_offset + len(inner.encode("utf-8"))
+                    break
+            else:
+                raise ValueError(f"{trace_path}: Snapshot for {rel_path} missing closing fence")
+            steps[-1]["snapshots"].append({"path": rel_path.as_posix(), "offset": offset, "end": end})
+    return {"version": STEP_INDEX_VERSION, "trace": trace_path.as_posix(), "size": size, "mtime_ns": mtime_ns, "steps": steps}
+
+
+def load_step_index(trace_path: Path, *, save: bool = True) -> dict:
+    """The trace's step index, rebuilt (and saved) when the trace changed."""
+    index_path = step_index_path(trace_path)
+    mtime_ns, size = stat_key(trace_path)
+    try:
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+        if (index.get("version"), index.get("size"), index.get("mtime_ns")) == (STEP_INDEX_VERSION, size, mtime_ns):
+            return index
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    index = build_step_index(trace_path)
+    if save:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(index, separators=(",", ":")) + "\n", encoding="utf-8")
+        os.replace(tmp_path, index_path)
+    return index
+
+
+def _read_range(f, start: int, end: int) -> str:
+    f.seek(start)
+    return f.read(end - start).decode("utf-8")
+
+
+def read_step(trace_path: Path, number: int, *, index: dict | None = None) -> StepText:
+    """Step `number` of a trace, reading only that step's bytes.
+
+    Equivalent to picking the step out of parse_trace_markdown(trace_path);
+    if several headings share the number, their snapshots are merged in
+    document order.
+    """
+    if index is None:
+        index = load_step_index(trace_path)
+    entries = [entry for entry in index["steps"] if entry["number"] == number]
+    if not entries:
+        raise KeyError(f"{trace_path} has no step {number}")
+
+    step: Step | None = None
+    narration: list[str] = []
+    with trace_path.open("rb") as f:
+        for entry in entries:
+            text = _read_range(f, entry["offset"], entry["end"])
+            for parsed in iter_document_steps(trace_path, text.splitlines()):
+                if step is None:
+                    step = parsed
+                else:
+                    step.snapshots.update(parsed.snapshots)
+
+            # Prose is what remains once the heading and the blocks are cut out.
+            cursor = entry["offset"]
+            pieces = []
+            for block in entry["snapshots"]:
+                pieces.append(_read_range(f, cursor, block["offset"]))
+                cursor = block["end"]
+            pieces.append(_read_range(f, cursor, entry["end"]) if cursor < entry["end"] else "")
+            body = "".join(pieces).split("\n", 1)
+            narration.append(re.sub(r"\n{3,}", "\n\n", body[1].strip()) if len(body) > 1 else "")
+
+    assert step is not None
+    return StepText(step=step, narration="\n\n".join(part for part in narration if part))
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Print one step of a trace without parsing the rest of it. The byte-offset index "
+            f"is kept in snapshots/<trace>/{STEP_INDEX_NAME} and rebuilt when the trace changes."
+        )
+    )
+    parser.add_argument("trace", type=Path)
+    parser.add_argument("step", type=int)
+    parser.add_argument("--path", help="Print only this snapshot file")
+    parser.add_argument("--json", action="store_true", help="Print the step as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        text = read_step(args.trace, args.step)
+    except (KeyError, ValueError) as e:
+        raise SystemExit(f"error: {e.args[0]}")
+
+    if args.path is not None:
+        if args.path not in text.step.snapshots:
+            raise SystemExit(f"error: step {args.step} of {args.trace} has no snapshot {args.path}")
+        print(text.step.snapshots[args.path], end="")
+    elif args.json:
+        print(json.dumps({"number": text.step.number, "title": text.step.title, "narration": text.narration, "snapshots": text.step.snapshots}, indent=2))
+    else:
+        print(f"Step {text.step.number}: {text.step.title}\n")
+        if text.narration:
+            print(text.narration + "\n")
+        for rel_path in sorted(text.step.snapshots):
+            print(f"Snapshot: {rel_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import os
+import shutil
+import stat
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from blob_store import BlobStore
+from timings import NO_TIMINGS, Timings
+
+
+# clean:     delete the output tree, then write every file (the default)
+# overwrite: write every file over whatever is already there (--no-clean)
+# sync:      write only files whose size or content differ, then delete files
+#            that are no longer part of the output; unchanged files keep their mtime
+# check:     write nothing; compare every planned file with what is on disk and
+#            record the differences in WriteStats.mismatches (--check)
+STRATEGIES = ("clean", "overwrite", "sync", "check")
+
+
+@dataclass
+class WriteStats:
+    written: int = 0
+    skipped: int = 0
+    removed: int = 0
+    bytes_written: int = 0
+    # "missing <path>", "differs <path>" or "extra <path>", check strategy only.
+    mismatches: list[str] = field(default_factory=list)
+
+    def add(self, other: WriteStats) -> None:
+        self.written += other.written
+        self.skipped += other.skipped
+        self.removed += other.removed
+        self.bytes_written += other.bytes_written
+        self.mismatches.extend(other.mismatches)
+
+
+class TreeWriter:
+    def __init__(self, root: Path, strategy: str = "clean", *, timings: Timings = NO_TIMINGS) -> None:
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown write strategy: {strategy}")
+        self.root = root
+        self.strategy = strategy
+        self.stats = WriteStats()
+        self.timings = timings
+        self._planned: set[Path] = set()
+        self._made_dirs: set[Path] = set()
+        if strategy == "clean" and root.exists():
+            with timings.phase("remove"):
+                shutil.rmtree(root)
+        self._mkdir(root)
+
+    @property
+    def dry_run(self) -> bool:
+        return self.strategy == "check"
+
+    def _mkdir(self, directory: Path) -> None:
+        if directory not in self._made_dirs and not self.dry_run:
+            with self.timings.phase("mkdir"):
+                directory.mkdir(parents=True, exist_ok=True)
+            self._made_dirs.add(directory)
+            self.timings.count("mkdir_calls")
+
+    def mkdir(self, rel_dir: Path | str) -> None:
+        self._mkdir(self.root / rel_dir)
+
+    def _prepare(self, rel_path: Path | str) -> Path:
+        target = self.root / rel_path
+        self._planned.add(target)
+        self._mkdir(target.parent)
+        return target
+
+    def write_bytes(self, rel_path: Path | str, data: bytes) -> None:
+        target = self._prepare(rel_path)
+        with self.timings.phase("write"):
+            self._write_bytes(target, data)
+
+    def _write_bytes(self, target: Path, data: bytes) -> None:
+        if self.dry_run:
+            if _has_content(target, data):
+                self.stats.skipped += 1
+            else:
+                self.stats.mismatches.append(f"{'differs' if target.exists() else 'missing'} {target.as_posix()}")
+            return
+        if self.strategy != "clean":
+            st = _lstat(target)
+            if st is not None and _is_blob_link(st):
+                # Never write through a link into a shared blob left by a --dedupe run.
+                target.unlink()
+            elif self.strategy == "sync" and _has_content(target, data):
+                self.stats.skipped += 1
+                return
+            elif st is not None and st.st_nlink > 1:
+                # Hardlinked from the changed-only layout: replace, don't write through.
+                target.unlink()
+        target.write_bytes(data)
+        self.stats.written += 1
+        self.stats.bytes_written += len(data)
+
+    def write_text(self, rel_path: Path | str, content: str) -> None:
+        self.write_bytes(rel_path, content.encode("utf-8"))
+
+    def link_blob(self, rel_path: Path | str, store: BlobStore, digest: str) -> None:
+        target = self._prepare(rel_path)
+        with self.timings.phase("write"):
+            if self.strategy == "sync" and target.exists() and os.path.samefile(target, store.blob_path(digest)):
+                self.stats.skipped += 1
+                return
+            store.materialize(digest, target)
+            self.stats.written += 1
+
+    def link_file(self, rel_path: Path | str, source: Path) -> None:
+        # Share `source` (a file written earlier in this run, e.g. by the
+        # full-state writer) instead of writing the same bytes again.
+        target = self._prepare(rel_path)
+        with self.timings.phase("write"):
+            if self.strategy == "sync" and target.exists() and os.path.samefile(target, source):
+                self.stats.skipped += 1
+                return
+            if self.strategy != "clean" and _lstat(target) is not None:
+                target.unlink()
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+                self.stats.bytes_written += source.stat().st_size
+            self.stats.written += 1
+
+    def finish(self) -> WriteStats:
+        if self.strategy == "sync":
+            with self.timings.phase("remove"):
+                self._remove_stale()
+        elif self.dry_run:
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    path = Path(dirpath) / name
+                    if path not in self._planned:
+                        self.stats.mismatches.append(f"extra {path.as_posix()}")
+        return self.stats
+
+    def _remove_stale(self) -> None:
+        for dirpath, dirnames, filenames in os.walk(self.root, topdown=False):
+            directory = Path(dirpath)
+            for name in filenames:
+                path = directory / name
+                if path not in self._planned:
+                    path.unlink()
+                    self.stats.removed += 1
+            for name in dirnames:
+                path = directory / name
+                if path.is_symlink():
+                    if path not in self._planned:
+                        path.unlink()
+                        self.stats.removed += 1
+                elif path not in self._made_dirs and not any(path.iterdir()):
+                    path.rmdir()
+
+
+def _lstat(target: Path) -> os.stat_result | None:
+    try:
+        return target.lstat()
+    except FileNotFoundError:
+        return None
+
+
+def _is_blob_link(st: os.stat_result) -> bool:
+    # Blob store files are read-only; a writable file with several links is
+    # shared between the two layouts of one run (see link_file).
+    return stat.S_ISLNK(st.st_mode) or (st.st_nlink > 1 and not st.st_mode & stat.S_IWUSR)
+
+
+def _has_content(target: Path, data: bytes) -> bool:
+    try:
+        if target.stat().st_size != len(data):
+            return False
+        return target.read_bytes() == data
+    except FileNotFoundError:
+        return False
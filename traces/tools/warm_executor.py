@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import atexit
+import io
+import locale
+import multiprocessing
+import os
+import runpy
+import signal
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from run_snapshots import Command, RunResult, run_command, run_env
+
+
+# Imported once by the fork server, so every run starts with them loaded
+# instead of paying for the imports (and the interpreter start) again.
+PRELOAD_MODULES = [
+    "warm_executor",
+    "argparse",
+    "collections",
+    "dataclasses",
+    "datetime",
+    "enum",
+    "functools",
+    "itertools",
+    "json",
+    "math",
+    "pathlib",
+    "random",
+    "re",
+    "shutil",
+    "string",
+    "subprocess",
+    "tempfile",
+    "textwrap",
+    "typing",
+]
+
+
+class WarmExecutor:
+    """Runs snapshot scripts in forks of a pre-warmed interpreter.
+
+    A fork server imports PRELOAD_MODULES once; its worker processes fork a
+    fresh child for every run, so no state leaks from one script to the next.
+    The child runs the script with runpy under the same argv, working
+    directory, stdin and environment a `python script.py` subprocess would
+    get, and its stdout/stderr file descriptors are captured directly.
+
+    Runs that cannot be trusted to match a real interpreter are repeated with
+    run_snapshots.run_command: scripts that shadow a preloaded module, runs
+    that time out (e.g. an input() loop that ignores EOF), and children that
+    die without reporting a result.
+    """
+
+    def __init__(self, workers: int) -> None:
+        # The fork server inherits the environment at start-up, and with it
+        # the hash seed that subprocess runs get from run_env().
+        saved_env = dict(os.environ)
+        os.environ.update(run_env())
+        try:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(PRELOAD_MODULES)
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            # Start the server (and the workers) now rather than on first use.
+            self._pool.submit(int).result()
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_env)
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> WarmExecutor:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._pool.shutdown()
+
+    def run_command(self, workdir: Path, script: str, command: Command, *, timeout: float) -> RunResult:
+        # Same signature and result as run_snapshots.run_command.
+        for rel_path, content in command.files:
+            (workdir / rel_path).write_text(content, encoding="utf-8")
+        outcome = self._pool.submit(
+            _run_in_fork, str(workdir), script, list(command.argv), command.stdin, timeout
+        ).result()
+        if outcome is None:
+            with self._lock:
+                self.fallbacks += 1
+            return run_command(workdir, script, command, timeout=timeout)
+        exit_code, stdout, stderr, duration = outcome
+        return RunResult(
+            script=script,
+            argv=list(command.argv),
+            exit_code=exit_code,
+            stdout=stdout,
+            stderr=stderr,
+            duration=duration,
+            ok=(exit_code == 0) == command.expect_ok,
+            executor="warm",
+        )
+
+
+def _shadows_preloaded(workdir: str) -> bool:
+    # A local json.py would be imported by a fresh interpreter, but a warm
+    # one already has the standard module loaded.
+    for name in os.listdir(workdir):
+        module = name[:-3] if name.endswith(".py") else name
+        if module in sys.modules:
+            return True
+    return False
+
+
+def _run_in_fork(workdir: str, script: str, argv: list[str], stdin: str, timeout: float) -> tuple | None:
+    # Runs in a fork-server worker. Returns (exit code, stdout, stderr,
+    # duration), or None when the caller should fall back to a subprocess.
+    if _shadows_preloaded(workdir):
+        return None
+    encoding = locale.getpreferredencoding(False)
+    with tempfile.TemporaryFile() as stdin_file, tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        stdin_file.write(stdin.encode(encoding))
+        stdin_file.seek(0)
+        start = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            _child(workdir, script, argv, stdin_file.fileno(), out.fileno(), err.fileno(), encoding)
+
+        deadline = start + timeout
+        delay = 0.0005
+        while True:
+            waited, status = os.waitpid(pid, os.WNOHANG)
+            if waited:
+                break
+            if time.perf_counter() >= deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+        duration = time.perf_counter() - start
+        if not os.WIFEXITED(status):
+            return None
+        return os.WEXITSTATUS(status), _read_text(out, encoding), _read_text(err, encoding), duration
+
+
+def _read_text(f, encoding: str) -> str:
+    # Decoded like subprocess.run(text=True): universal newlines.
+    f.seek(0)
+    return io.TextIOWrapper(f, encoding=encoding, newline=None).read()
+
+
+def _child(workdir: str, script: str, argv: list[str], stdin_fd: int, out_fd: int, err_fd: int, encoding: str) -> None:
+    code = 1
+    try:
+        os.dup2(stdin_fd, 0)
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        sys.stdin = io.TextIOWrapper(io.FileIO(0, "r", closefd=False), encoding=encoding)
+        sys.stdout = io.TextIOWrapper(io.FileIO(1, "w", closefd=False), encoding=encoding)
+        sys.stderr = io.TextIOWrapper(
+            io.FileIO(2, "w", closefd=False), encoding=encoding, errors="backslashreplace", line_buffering=True
+        )
+        os.chdir(workdir)
+        sys.argv = [script, *argv]
+        sys.path[0] = workdir
+        code = _run_main(os.path.join(workdir, script))
+        atexit._run_exitfuncs()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _run_main(path: str) -> int:
+    # Exit status as the interpreter would report it for `python path`.
+    try:
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code & 0xFF
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Hide the runpy and executor frames, as `python path` has none.
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_globals.get("__name__") in ("runpy", __name__):
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb)
+        return 1
+    return 0